@@ -0,0 +1,47 @@
+"""
+Runs benchmark suites and prints their results as json, for comparing runs on different commits.
+
+    python -m benchmarks [codec] [diff] [handlers] [--output results.json]
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+
+from . import codec, diff, handlers
+
+SUITES = {
+    'codec': codec.run,
+    'diff': diff.run,
+    'handlers': handlers.run,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    parser.add_argument('suites', nargs='*', help=f'any of {", ".join(SUITES)}, all when omitted')
+    parser.add_argument('--output', help='file to write results to instead of stdout')
+    args = parser.parse_args()
+
+    unknown = [name for name in args.suites if name not in SUITES]
+    if unknown:
+        parser.error(f'unknown suites: {", ".join(unknown)}')
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'started': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'results': {name: SUITES[name]() for name in args.suites or SUITES},
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
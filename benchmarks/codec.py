@@ -0,0 +1,65 @@
+"""
+Compares the binary wire codec with the json serializer on chunk-like events.
+
+    python -m benchmarks.codec
+"""
+import os
+import time
+import tracemalloc
+
+from kombu.serialization import dumps, loads
+
+from rabbitmq_sync import codec
+
+PAYLOAD_SIZES = [1024, 64 * 1024, 1024 * 1024, 8 * 1024 * 1024]
+SERIALIZERS = [codec.JSON_NAME, codec.NAME]
+
+
+def make_event(size: int) -> dict:
+    return {
+        'event_type': 'chunk',
+        'path': 'some/directory/file.bin',
+        'transfer_id': '5f0c6b2e-8f3a-4d59-9d1e-0b7c0f6f9a11',
+        'seq': 3,
+        'offset': 3 * size,
+        'total_size': 10 * size,
+        'content': os.urandom(size),
+    }
+
+
+def round_trip(event: dict, serializer: str):
+    content_type, content_encoding, body = dumps(event, serializer=serializer)
+    decoded = loads(body, content_type, content_encoding)
+    return body, decoded
+
+
+def measure(size: int, serializer: str) -> dict:
+    event = make_event(size)
+    repeat = max(3, (64 * 1024 * 1024) // size)
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        body, _ = round_trip(event, serializer)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    round_trip(event, serializer)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'serializer': serializer,
+        'payload_size': size,
+        'body_size': len(body),
+        'mb_per_second': round(size * repeat / elapsed / 1024 / 1024, 1),
+        'peak_allocated_to_payload': round(peak / size, 2),
+    }
+
+
+def run() -> list[dict]:
+    return [measure(size, serializer) for size in PAYLOAD_SIZES for serializer in SERIALIZERS]
+
+
+if __name__ == '__main__':
+    for result in run():
+        print(result)
@@ -0,0 +1,100 @@
+"""
+Measures two-way resolution, git-style diffs and three-way merges on synthetic text.
+
+Every corpus is a base file and two edited versions of it, generated from a fixed seed,
+so runs on different commits diff the same inputs.
+
+    python -m benchmarks.diff
+"""
+import random
+import time
+
+from rabbitmq_sync.utils.diff import git_diff, git_diff_resolve
+from rabbitmq_sync.utils.merge import merge3
+
+LINE_COUNTS = [1000, 10000, 100000]
+# share of lines edited on each side
+EDIT_DENSITIES = [0.001, 0.01, 0.05]
+# disjoint: sides edit different lines, overlapping: both edit the same lines differently,
+# append: both sides only add lines at the end
+PATTERNS = ['disjoint', 'overlapping', 'append']
+SEED = 1
+REPEAT = 3
+DIFF_POSTFIX = '*rabbit-sync-diff*'
+
+
+def make_corpus(line_count: int, density: float, pattern: str) -> tuple[str, str, str]:
+    rng = random.Random(f'{SEED}-{line_count}-{density}-{pattern}')
+    base = [f'{i:08d} ' + ' '.join(rng.choice(WORDS) for _ in range(8)) for i in range(line_count)]
+    a, b = list(base), list(base)
+    edits = max(1, int(line_count * density))
+
+    if pattern == 'append':
+        a.extend(f'a appended {i}' for i in range(edits))
+        b.extend(f'b appended {i}' for i in range(edits))
+    elif pattern == 'overlapping':
+        for i in rng.sample(range(line_count), edits):
+            a[i] = f'a edited {i}'
+            b[i] = f'b edited {i}'
+    else:
+        lines = rng.sample(range(line_count), 2 * edits)
+        for i in lines[:edits]:
+            a[i] = f'a edited {i}'
+        for i in lines[edits:]:
+            b[i] = f'b edited {i}'
+
+    return '\n'.join(base) + '\n', '\n'.join(a) + '\n', '\n'.join(b) + '\n'
+
+
+def timed(func, *args, **kwargs) -> tuple[float, object]:
+    best = None
+    result = None
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def measure(line_count: int, density: float, pattern: str) -> list[dict]:
+    base, a, b = make_corpus(line_count, density, pattern)
+    cases = {
+        'git_diff_resolve': lambda: git_diff_resolve(a, b, auto_resolve='b', diff_postfix=DIFF_POSTFIX),
+        'git_diff': lambda: git_diff(a, b),
+        'merge3': lambda: merge3(base, a, b, diff_postfix=DIFF_POSTFIX),
+    }
+
+    results = []
+    for name, func in cases.items():
+        seconds, output = timed(func)
+        results.append({
+            'function': name,
+            'lines': line_count,
+            'edit_density': density,
+            'pattern': pattern,
+            'seconds': round(seconds, 5),
+            'lines_per_second': round(line_count / seconds),
+            'conflicts': output.count('<' * 7),
+        })
+    return results
+
+
+def run() -> list[dict]:
+    return [
+        result
+        for line_count in LINE_COUNTS
+        for density in EDIT_DENSITIES
+        for pattern in PATTERNS
+        for result in measure(line_count, density, pattern)
+    ]
+
+
+WORDS = [
+    'sync', 'queue', 'file', 'event', 'merge', 'block', 'path', 'client', 'content', 'hash',
+    'chunk', 'diff', 'line', 'base', 'index', 'watch', 'rabbit', 'message', 'header', 'body',
+]
+
+if __name__ == '__main__':
+    for result in run():
+        print(result)
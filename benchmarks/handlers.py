@@ -0,0 +1,192 @@
+"""
+End-to-end throughput of the filesystem and copy handlers over the in-memory kombu transport.
+
+Events go through the same producers, serializer and compression as in production and are dispatched
+to the handlers returned by register(), so encoding, merging and writing are all part of the numbers.
+Files are created in a temporary directory, the process works in it while the suite runs.
+
+    python -m benchmarks.handlers
+"""
+import os
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from kombu import Connection, Consumer, Queue
+
+from rabbitmq_sync import definitions
+from rabbitmq_sync.codec import ACCEPT_CONTENT
+
+# files and lines per file of the filesystem cases
+TEXT_FILE_COUNT = 200
+TEXT_FILE_LINES = 2000
+# merge: how the receiver combines its version with the incoming one
+MERGES = ['two-way', 'three-way', 'delta']
+# (name, file count, file size) of the copy cases
+COPY_CASES = [
+    ('small-files', 2000, 4 * 1024),
+    ('large-files', 8, 16 * 1024 * 1024),
+]
+DRAIN_TIMEOUT_SECONDS = 30
+SEED = 1
+
+# receives everything published to the main exchange, like the queue of another client
+benchmark_queue = Queue('benchmark', exchange=definitions.main_exchange)
+
+
+def make_text(rng: random.Random, line_count: int) -> list[str]:
+    return [f'{i:06d} ' + ' '.join(rng.choice(WORDS) for _ in range(8)) for i in range(line_count)]
+
+
+def edit(rng: random.Random, lines: list[str], side: str, count: int = 5) -> str:
+    lines = list(lines)
+    # sides edit different halves of the file, merges never conflict
+    half = len(lines) // 2
+    offset = 0 if side == 'a' else half
+    for i in rng.sample(range(offset, offset + half), count):
+        lines[i] = f'{side} edited {i}'
+    return '\n'.join(lines) + '\n'
+
+
+def consume(connection: Connection, handlers: dict, expected: int, count=lambda result: 1) -> int:
+    """Dispatches events from the benchmark queue until count of handler results reaches expected, returns bytes received"""
+    done = 0
+    received = 0
+
+    def on_message(body, message):
+        nonlocal done, received
+        received += len(message.body)
+        done += count(handlers[body['event_type']](body))
+        message.ack()
+
+    with Consumer(connection, queues=[benchmark_queue], callbacks=[on_message], accept=ACCEPT_CONTENT):
+        while done < expected:
+            connection.drain_events(timeout=DRAIN_TIMEOUT_SECONDS)
+    return received
+
+
+def measure_filesystem(connection: Connection, merge: str) -> dict:
+    from rabbitmq_sync.filesystem import handlers as filesystem
+    from rabbitmq_sync.filesystem.bases import base_store
+    from rabbitmq_sync.filesystem.events import EVENT_TYPE_CONTENT
+    from rabbitmq_sync.utils import bytes_hash
+    from rabbitmq_sync.utils.delta import signature, delta
+
+    rng = random.Random(f'{SEED}-{merge}')
+    root = Path(f'filesystem-{merge}')
+    root.mkdir()
+
+    handlers = filesystem.register(connection)
+    handler = filesystem.FileSystemEventHandler(connection)
+    events = []
+    for i in range(TEXT_FILE_COUNT):
+        path = root / f'file-{i}.txt'
+        base = make_text(rng, TEXT_FILE_LINES)
+        local = edit(rng, base, 'a').encode()
+        remote = edit(rng, base, 'b').encode()
+        path.write_bytes(local)
+
+        event = {
+            'event_type': EVENT_TYPE_CONTENT,
+            'src_path': path.as_posix(),
+            'timestamp': time.time() + 1,
+            'edited_on': time.time() + 1,
+            'hash': bytes_hash(remote),
+        }
+        if merge == 'delta':
+            local_signature = signature(local)
+            event['delta'] = delta(remote, local_signature)
+            event['block_size'] = local_signature['block_size']
+            event['base_hash'] = bytes_hash(local)
+        else:
+            event['content'] = remote.decode()
+        if merge == 'three-way':
+            base_store.record(path, ('\n'.join(base) + '\n').encode())
+        events.append(event)
+
+    size = sum(path.stat().st_size for path in root.iterdir())
+
+    start = time.perf_counter()
+    for event in events:
+        handler.publish(event)
+    received = consume(connection, handlers, len(events))
+    elapsed = time.perf_counter() - start
+
+    return {
+        'handler': 'filesystem',
+        'case': merge,
+        'files': len(events),
+        'file_size': size // len(events),
+        'bytes_sent': received,
+        'seconds': round(elapsed, 4),
+        'files_per_second': round(len(events) / elapsed, 1),
+        'mb_per_second': round(size / elapsed / 1024 / 1024, 2),
+    }
+
+
+def measure_copy(connection: Connection, name: str, count: int, size: int) -> dict:
+    from rabbitmq_sync.copy import handler as copy
+
+    rng = random.Random(f'{SEED}-{name}')
+    root = Path(f'copy-{name}')
+    root.mkdir()
+
+    paths = []
+    for i in range(count):
+        path = root / f'file-{i}.bin'
+        if size >= 1024 * 1024:
+            path.write_bytes(os.urandom(size))
+        else:
+            path.write_text(' '.join(rng.choice(WORDS) for _ in range(size // 6))[:size])
+        paths.append(path)
+    total = sum(path.stat().st_size for path in paths)
+
+    handler = copy.Handler(connection)
+    handlers = {
+        copy.EVENT_TYPE_CHUNK: handler.on_chunk,
+        copy.EVENT_TYPE_BUNDLE: handler.on_bundle,
+    }
+
+    start = time.perf_counter()
+    handler.pipeline.send(paths)
+    # a chunk that completes a transfer is one file, a bundle returns its files
+    received = consume(connection, handlers, count,
+                       count=lambda result: len(result) if isinstance(result, list) else int(bool(result)))
+    elapsed = time.perf_counter() - start
+
+    return {
+        'handler': 'copy',
+        'case': name,
+        'files': count,
+        'file_size': size,
+        'bytes_sent': received,
+        'seconds': round(elapsed, 4),
+        'files_per_second': round(count / elapsed, 1),
+        'mb_per_second': round(total / elapsed / 1024 / 1024, 2),
+    }
+
+
+def run() -> list[dict]:
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix='rabbit-sync-benchmark-') as workdir:
+        # handlers resolve paths against the working directory
+        os.chdir(workdir)
+        try:
+            with Connection('memory://') as connection:
+                benchmark_queue(connection.default_channel).declare()
+                results = [measure_filesystem(connection, merge) for merge in MERGES]
+                results += [measure_copy(connection, *case) for case in COPY_CASES]
+        finally:
+            os.chdir(cwd)
+    return results
+
+
+WORDS = [
+    'sync', 'queue', 'file', 'event', 'merge', 'block', 'path', 'client', 'content', 'hash',
+    'chunk', 'diff', 'line', 'base', 'index', 'watch', 'rabbit', 'message', 'header', 'body',
+]
+
+if __name__ == '__main__':
+    for result in run():
+        print(result)
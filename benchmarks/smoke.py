@@ -0,0 +1,62 @@
+"""
+Smoke check of the handler wiring: events are dispatched to get_handlers() the way the worker of start() does,
+it fails when a handler is missing or raises.
+Files are created in a temporary directory, the process works in it while the check runs.
+
+    python -m benchmarks.smoke
+"""
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from kombu import Connection
+
+
+def check(connection: Connection):
+    from rabbitmq_sync import get_handlers
+    from rabbitmq_sync.rabbitmq import Worker
+    from rabbitmq_sync.filesystem.events import EVENT_TYPE_BATCH, EVENT_TYPE_CONTENT, EVENT_TYPE_CREATED
+
+    worker = Worker(connection, get_handlers(connection))
+    for event_type in (EVENT_TYPE_BATCH, EVENT_TYPE_CONTENT):
+        assert any(event_type in handlers for handlers in worker.handlers), f'no handler for {event_type}'
+
+    now = time.time() + 1
+    worker.process_handlers({
+        'event_type': EVENT_TYPE_CONTENT,
+        'client_id': 'smoke',
+        'src_path': 'content.txt',
+        'timestamp': now,
+        'edited_on': now,
+        'content': 'synchronized\n',
+    })
+    assert Path('content.txt').read_text() == 'synchronized\n', 'content event was not written'
+
+    worker.process_handlers({
+        'event_type': EVENT_TYPE_BATCH,
+        'client_id': 'smoke',
+        'events': [{
+            'event_type': EVENT_TYPE_CREATED,
+            'src_path': 'created',
+            'is_directory': True,
+            'timestamp': now,
+        }],
+    })
+    assert Path('created').is_dir(), 'batched event was not dispatched'
+
+
+def run():
+    previous = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            with Connection('memory://') as connection:
+                check(connection)
+        finally:
+            os.chdir(previous)
+
+
+if __name__ == '__main__':
+    run()
+    print('ok')
@@ -2,6 +2,7 @@ import threading
 from threading import Thread
 
 from kombu import Connection
+from rabbitmq_sync.filesystem.index import file_index
 from rabbitmq_sync.filesystem.utils import cwd
 from rabbitmq_sync.filesystem.watcher import start_observing_filesystem
 from .definitions import create, delete
@@ -17,6 +18,7 @@ def start(rabbit_url: str):
     setup_logging(loglevel='INFO', loggers=[''])
 
     with Connection(rabbit_url) as conn:
+        file_index.reconcile()
         start_observing_filesystem(cwd, conn)
 
         channel = conn.channel()
@@ -33,9 +35,11 @@ def start(rabbit_url: str):
 
 def get_handlers(connection: Connection) -> HandlersType:
     from rabbitmq_sync.copy import register as register_copy
+    from rabbitmq_sync.filesystem import register as register_filesystem
     from rabbitmq_sync.http import register as register_http
 
     return [
         register_copy(connection),
+        register_filesystem(connection),
         register_http(connection),
     ]
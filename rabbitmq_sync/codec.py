@@ -0,0 +1,130 @@
+"""
+Binary wire codec.
+
+Events are dicts of json-compatible values where payloads are bytes. Json has to base64 them,
+this codec instead puts the event with bytes replaced by placeholders into a small json header
+and appends the raw payloads after it:
+
+    4 bytes header length | json header | payload 0 | payload 1 | ...
+
+Decoded payloads are memoryview slices of the message body, they are never copied.
+
+JSON_NAME is the json wire format of clients that do not know the codec: payloads are sent as base64 strings,
+kombu's json serializer would send bytes as objects those clients cannot read.
+
+Like compression, the codec is negotiated: clients advertise the serializers they read in ping/pong and the codec
+is only used for messages every receiver advertised it for, json otherwise and until the first client is known.
+"""
+import base64
+import json
+import struct
+from threading import Lock
+from typing import Optional
+
+from kombu import serialization
+from kombu.utils import json as kombu_json
+
+from .settings import SERIALIZER
+
+NAME = 'rabbit-sync'
+CONTENT_TYPE = 'application/x-rabbit-sync'
+JSON_NAME = 'rabbit-sync-json'
+ACCEPT_CONTENT = ['json', NAME]
+
+BLOB_KEY = '__blob__'
+HEADER_LENGTH = struct.Struct('!I')
+
+BytesLike = bytes | bytearray | memoryview
+
+SUPPORTED_SERIALIZERS = [NAME] if SERIALIZER == NAME else []
+
+peer_serializers: dict[str, set[str]] = dict()
+lock = Lock()
+
+
+def encode(event: dict) -> bytes:
+    blobs = []
+
+    def replace_blobs(value):
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            blobs.append(value)
+            return {BLOB_KEY: len(value)}
+        if isinstance(value, dict):
+            return {k: replace_blobs(v) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [replace_blobs(v) for v in value]
+        return value
+
+    header = json.dumps(replace_blobs(event), separators=(',', ':')).encode()
+
+    return b''.join([HEADER_LENGTH.pack(len(header)), header, *blobs])
+
+
+def decode(body: BytesLike) -> dict:
+    view = memoryview(body)
+    header_end = HEADER_LENGTH.size + HEADER_LENGTH.unpack_from(view)[0]
+    offset = header_end
+
+    def restore_blobs(value: dict):
+        nonlocal offset
+        if BLOB_KEY not in value:
+            return value
+        # object hooks run in document order, the same order blobs were appended in
+        blob = view[offset:offset + value[BLOB_KEY]]
+        offset += value[BLOB_KEY]
+        return blob
+
+    return json.loads(view[HEADER_LENGTH.size:header_end].tobytes(), object_hook=restore_blobs)
+
+
+def encode_json(event: dict) -> str:
+    def base64_blobs(value):
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return base64.b64encode(value).decode()
+        if isinstance(value, dict):
+            return {k: base64_blobs(v) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [base64_blobs(v) for v in value]
+        return value
+
+    return json.dumps(base64_blobs(event))
+
+
+def as_bytes(value: BytesLike | str) -> BytesLike:
+    """Payload of an event, older clients send payloads base64 encoded"""
+    if isinstance(value, str):
+        return base64.b64decode(value)
+    return value
+
+
+def on_peer(client_id: str, serializers: Optional[list[str]]):
+    with lock:
+        peer_serializers[client_id] = set(serializers or ())
+
+
+def forget_peer(client_id: str):
+    with lock:
+        peer_serializers.pop(client_id, None)
+
+
+def negotiated(to: str = None) -> str:
+    """Serializer for a message to every client, or to one client when its id is given"""
+    with lock:
+        if to is not None:
+            peers = [peer_serializers.get(to, set())]
+        else:
+            peers = list(peer_serializers.values())
+
+    if SUPPORTED_SERIALIZERS and peers and all(NAME in serializers for serializers in peers):
+        return NAME
+    return JSON_NAME
+
+
+def register():
+    serialization.register(NAME, encode, decode, content_type=CONTENT_TYPE, content_encoding='binary')
+    # same content type as kombu's json, so it decodes whatever json arrives the way kombu does
+    serialization.register(JSON_NAME, encode_json, kombu_json.loads, content_type='application/json',
+                           content_encoding='utf-8')
+
+
+register()
@@ -0,0 +1,75 @@
+"""
+Negotiated payload compression.
+
+Clients advertise the codecs they can decompress in ping/pong. Content-bearing events are compressed with
+the first preferred codec every known client supports, kombu then sets the compression header and
+decompresses on the receiving side. Clients that do not advertise anything get uncompressed messages,
+so does everybody until the first client is known.
+"""
+import math
+from collections import Counter
+from threading import Lock
+from typing import Optional
+
+from .settings import COMPRESSION, COMPRESSION_MIN_SIZE, COMPRESSION_MAX_ENTROPY
+
+SAMPLE_SIZE = 1024
+SAMPLE_COUNT = 4
+PAYLOAD_KEYS = ('content', 'body')
+
+SUPPORTED_ENCODINGS = [name for name in COMPRESSION if name in ('zlib', 'lzma')]
+
+peer_encodings: dict[str, set[str]] = dict()
+lock = Lock()
+
+
+def on_peer(client_id: str, encodings: Optional[list[str]]):
+    with lock:
+        peer_encodings[client_id] = set(encodings or ())
+
+
+def forget_peer(client_id: str):
+    with lock:
+        peer_encodings.pop(client_id, None)
+
+
+def negotiated() -> Optional[str]:
+    with lock:
+        peers = list(peer_encodings.values())
+
+    if not peers:
+        # nothing is known about who receives it
+        return None
+    for name in SUPPORTED_ENCODINGS:
+        if all(name in encodings for encodings in peers):
+            return name
+    return None
+
+
+def for_event(event: dict) -> Optional[str]:
+    """Compression to publish event with, None to send it as is"""
+    payload = next((event[key] for key in PAYLOAD_KEYS if key in event), None)
+    if payload is None:
+        return None
+
+    if isinstance(payload, str):
+        payload = payload.encode()
+
+    if len(payload) < COMPRESSION_MIN_SIZE or sampled_entropy(payload) > COMPRESSION_MAX_ENTROPY:
+        return None
+
+    return negotiated()
+
+
+def sampled_entropy(payload: bytes) -> float:
+    """Shannon entropy in bits per byte of a few slices spread over the payload"""
+    view = memoryview(payload)
+    step = max(SAMPLE_SIZE, len(view) // SAMPLE_COUNT)
+
+    counts = Counter()
+    for start in range(0, len(view), step):
+        counts.update(view[start:start + SAMPLE_SIZE].tobytes())
+
+    total = sum(counts.values())
+    return -sum(count / total * math.log2(count / total) for count in counts.values())
+
@@ -0,0 +1,66 @@
+import io
+import logging
+import os
+import tarfile
+import uuid
+from pathlib import Path
+
+from rabbitmq_sync.codec import as_bytes
+from rabbitmq_sync.filesystem.echo import written_files
+from rabbitmq_sync.filesystem.index import file_index
+from .config import BUNDLE_COMPRESSION, BUNDLE_COMPRESSION_LEVEL, PART_POSTFIX
+from .events import FileBundle, EVENT_TYPE_BUNDLE
+from .utils import str_to_path, complain_if_not_in_cwd
+
+
+def pack(paths: list[Path], compression: str = BUNDLE_COMPRESSION, level: int = BUNDLE_COMPRESSION_LEVEL) -> FileBundle:
+    buffer = io.BytesIO()
+
+    # tarfile names the level differently per codec and rejects it without compression
+    options = {'gz': {'compresslevel': level}, 'xz': {'preset': level}}.get(compression, {})
+    with tarfile.open(fileobj=buffer, mode=f'w:{compression}', **options) as tar:
+        for path in paths:
+            tar.add(path, arcname=path.as_posix(), recursive=False)
+
+    bundle: FileBundle = {
+        'event_type': EVENT_TYPE_BUNDLE,
+        'bundle_id': str(uuid.uuid4()),
+        'compression': compression,
+        'content': buffer.getvalue(),
+    }
+
+    return bundle
+
+
+def unpack(bundle: FileBundle) -> list[Path]:
+    """Extract all files of the bundle or none of them"""
+    buffer = io.BytesIO(as_bytes(bundle['content']))
+    extracted: list[tuple[Path, Path]] = []
+
+    try:
+        with tarfile.open(fileobj=buffer, mode=f'r:{bundle["compression"]}') as tar:
+            for member in tar:
+                if not member.isfile():
+                    logging.warning('Skipping %s in bundle, only regular files are supported', member.name)
+                    continue
+
+                path = str_to_path(member.name)
+                complain_if_not_in_cwd(path)
+
+                part_path = path.with_name(f'.{path.name}.{bundle["bundle_id"][:8]}{PART_POSTFIX}')
+                path.parent.mkdir(parents=True, exist_ok=True)
+                with tar.extractfile(member) as source, open(part_path, 'wb') as target:
+                    extracted.append((part_path, path))
+                    while block := source.read(1024 * 1024):
+                        target.write(block)
+    except Exception:
+        for part_path, _ in extracted:
+            part_path.unlink(missing_ok=True)
+        raise
+
+    for part_path, path in extracted:
+        os.replace(part_path, path)
+        written_files.record(path)
+        file_index.update(path)
+
+    return [path for _, path in extracted]
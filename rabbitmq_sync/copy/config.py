@@ -0,0 +1,38 @@
+import configparser
+
+from rabbitmq_sync.filesystem.config import PART_POSTFIX
+
+config = configparser.ConfigParser()
+config.read('rabbit_sync.ini')
+
+# example
+#
+# [copy]
+# chunk_size = 1048576
+# transfer_timeout = 300
+# read_workers = 4
+# queue_size = 16
+# confirm_window = 32
+# bandwidth_limit = 0
+# bundle_file_size = 65536
+# bundle_size = 4194304
+# bundle_compression = gz
+# bundle_compression_level = 1
+
+CHUNK_SIZE = config.getint('copy', 'chunk_size', fallback=1024 * 1024)
+TRANSFER_TIMEOUT_SECONDS = config.getfloat('copy', 'transfer_timeout', fallback=300.)
+READ_WORKERS = config.getint('copy', 'read_workers', fallback=4)
+# chunks waiting to be published, bounds memory used by readers
+QUEUE_SIZE = config.getint('copy', 'queue_size', fallback=16)
+# published but not yet confirmed by the broker messages, 0 disables publisher confirms
+CONFIRM_WINDOW = config.getint('copy', 'confirm_window', fallback=32)
+# bytes per second, 0 means unlimited
+BANDWIDTH_LIMIT = config.getint('copy', 'bandwidth_limit', fallback=0)
+# files smaller than this are packed together into bundles, 0 disables bundling
+BUNDLE_FILE_SIZE = config.getint('copy', 'bundle_file_size', fallback=64 * 1024)
+# uncompressed size of files in one bundle
+BUNDLE_SIZE = config.getint('copy', 'bundle_size', fallback=4 * 1024 * 1024)
+# gz (zlib), xz (lzma) or empty for none, higher levels and xz make packing cpu-bound far below link speed
+BUNDLE_COMPRESSION = config.get('copy', 'bundle_compression', fallback='gz')
+# 1-9 for gz, 0-9 for xz
+BUNDLE_COMPRESSION_LEVEL = config.getint('copy', 'bundle_compression_level', fallback=1)
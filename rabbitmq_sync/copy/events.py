@@ -1,7 +1,12 @@
+from typing_extensions import NotRequired
+
 from rabbitmq_sync.events import BaseEvent
 
 EVENT_TYPE_CONTENT = 'content'
+EVENT_TYPE_CHUNK = 'chunk'
+EVENT_TYPE_BUNDLE = 'bundle'
 EVENT_TYPE_REQUEST_ALL = 'request_all'
+EVENT_TYPE_REQUEST_FILES = 'request_files'
 
 
 class FilePath(BaseEvent):
@@ -9,4 +14,27 @@ class FilePath(BaseEvent):
 
 
 class FileContent(FilePath):
-    content: str
+    content: bytes | str
+
+
+class FileChunk(FilePath):
+    transfer_id: str
+    seq: int
+    offset: int
+    total_size: int
+    content: bytes
+    # set only on the last chunk of a transfer, total_size is final then
+    checksum: NotRequired[str]
+
+
+class FileBundle(BaseEvent):
+    bundle_id: str
+    # tarfile compression: xz, gz or empty
+    compression: str
+    # tar archive with paths relative to cwd
+    content: bytes
+
+
+class FilesRequest(BaseEvent):
+    # files or whole directories
+    paths: list[str]
@@ -1,12 +1,22 @@
-import base64
 import logging
 import sys
+from pathlib import Path
+from typing import Optional
 from kombu import Connection, Producer
 from kombu.pools import producers
+from .bundle import unpack
 from .events import *
+from .pipeline import CopyPipeline
+from .transfer import IncomingTransfers
 from .utils import path_edited_on, str_to_path, complain_if_not_in_cwd, cwd
-from rabbitmq_sync import definitions
+from rabbitmq_sync import definitions, compression, codec
+from rabbitmq_sync.codec import as_bytes
 from rabbitmq_sync.events import EVENT_INTERNAL_READY
+from rabbitmq_sync.filesystem.events import Tree, TreeRequest, EVENT_TYPE_TREE, EVENT_TYPE_TREE_REQUEST
+from rabbitmq_sync.filesystem.echo import written_files
+from rabbitmq_sync.filesystem.ignore import ignore_rules
+from rabbitmq_sync.filesystem.index import file_index
+from rabbitmq_sync.filesystem.manifest import Manifest, join_path
 
 
 def register(connection: Connection):
@@ -15,54 +25,168 @@ def register(connection: Connection):
     return {
         EVENT_INTERNAL_READY: handler.on_ready,
         EVENT_TYPE_REQUEST_ALL: handler.on_request,
+        EVENT_TYPE_REQUEST_FILES: handler.on_request_files,
+        EVENT_TYPE_TREE_REQUEST: handler.on_tree_request,
+        EVENT_TYPE_TREE: handler.on_tree,
         EVENT_TYPE_CONTENT: handler.on_content,
+        EVENT_TYPE_CHUNK: handler.on_chunk,
+        EVENT_TYPE_BUNDLE: handler.on_bundle,
     }
 
 
 class Handler:
     def __init__(self, connection: Connection):
         self.connection = connection
+        self.incoming = IncomingTransfers()
+        self.manifest = Manifest(cwd, file_index, ignore_rules)
+        self.pipeline = CopyPipeline(connection)
+        # client whose tree the running walk follows, the first one to answer the root request
+        self.walk_peer: Optional[str] = None
 
     def on_ready(self, event):
         if 'copy' in sys.argv:
             logging.info('Requesting all content')
 
-            request_all: BaseEvent = {
-                'event_type': EVENT_TYPE_REQUEST_ALL,
+            self.manifest.refresh()
+            self.walk_peer = None
+            self.request_tree('')
+
+    def request_tree(self, path: str, to: str = None):
+        local_node = self.manifest.node_at(path)
+
+        tree_request: TreeRequest = {
+            'event_type': EVENT_TYPE_TREE_REQUEST,
+            'path': path,
+            'hash': local_node.hash if local_node is not None else '',
+            'requester': definitions.client_id,
+        }
+
+        # the root is asked of everybody, subtrees only of the client the walk follows
+        self.publish(tree_request, to=to)
+
+    def on_tree_request(self, event: TreeRequest):
+        # files below path may have changed since the previous request of the walk
+        self.manifest.refresh(event['path'])
+
+        node = self.manifest.node_at(event['path'])
+        if node is None or not node.is_directory or node.hash == event['hash']:
+            return
+
+        tree: Tree = {
+            'event_type': EVENT_TYPE_TREE,
+            'path': event['path'],
+            'hash': node.hash,
+            'requester': event['requester'],
+            'entries': {
+                name: {
+                    'hash': child.hash,
+                    'is_directory': child.is_directory,
+                    'size': child.size,
+                }
+                for name, child in node.children.items()
             }
+        }
 
-            self.publish(request_all)
+        self.publish(tree, to=event['client_id'])
 
-    def on_request(self, event: BaseEvent):
-        for p in cwd.rglob('*'):
-            if p.is_dir():
+    def on_tree(self, event: Tree):
+        if event['requester'] != definitions.client_id:
+            return
+
+        if self.walk_peer is None:
+            self.walk_peer = event['client_id']
+        elif event['client_id'] != self.walk_peer:
+            # every client answers the root request, the same files are fetched from one of them only
+            return
+
+        local_node = self.manifest.node_at(event['path'])
+        local_children = local_node.children if local_node is not None and local_node.is_directory else dict()
+
+        missing_paths = []
+        for name, entry in event['entries'].items():
+            path = join_path(event['path'], name)
+            local_child = local_children.get(name)
+
+            if local_child is not None and local_child.hash == entry['hash']:
                 continue
 
-            print(p)
+            if entry['is_directory'] and local_child is not None and local_child.is_directory:
+                self.request_tree(path, to=self.walk_peer)
+            else:
+                # whole directories that only exist on the other side are requested at once
+                missing_paths.append(path)
 
-            content: FileContent = {
-                'event_type': EVENT_TYPE_CONTENT,
-                'path': str(p.relative_to(cwd)),
-                'content': base64.b64encode(p.read_bytes()).decode('utf-8')
+        if missing_paths:
+            files_request: FilesRequest = {
+                'event_type': EVENT_TYPE_REQUEST_FILES,
+                'paths': missing_paths,
             }
 
-            self.publish(content)
+            self.publish(files_request, to=self.walk_peer)
+
+    def on_request(self, event: BaseEvent):
+        self.pipeline.send(self.iter_files([cwd]))
+
+    def on_request_files(self, event: FilesRequest):
+        paths = [str_to_path(str_path) for str_path in event['paths']]
+        for path in paths:
+            complain_if_not_in_cwd(path)
+
+        self.pipeline.send(self.iter_files(paths))
+
+    @staticmethod
+    def iter_files(paths: list[Path]):
+        for path in paths:
+            if path.is_dir():
+                files = ignore_rules.walk(path)
+            elif path.is_file() and not ignore_rules.is_ignored(path):
+                files = [path]
+            else:
+                continue
+
+            for p in files:
+                yield p.relative_to(cwd)
+
+    def publish(self, content: dict, to: str = None):
+        """Broadcast to every client, or send to one client when its id is known"""
+        exchange = definitions.main_exchange if to is None else definitions.peer_exchange(to)
 
-    def publish(self, content: dict):
         with producers[self.connection].acquire(block=False) as producer:
             producer: Producer
+            if to is not None and not definitions.peer_connected(producer.channel, to):
+                logging.info('Not sending %s, client %s left', content['event_type'], to)
+                return
+
             producer.publish(content,
-                             exchange=definitions.main_exchange,
+                             exchange=exchange,
                              routing_key='event.copy',
-                             headers={'client_id': definitions.client_id})
+                             headers={'client_id': definitions.client_id},
+                             serializer=codec.negotiated(to),
+                             compression=compression.for_event(content))
 
     def on_content(self, event: FileContent):
+        if 'path' not in event:
+            # content of a synchronized file, see filesystem.handlers
+            return
+
         event_path = str_to_path(event['path'])
 
         complain_if_not_in_cwd(event_path)
 
         event_path.parent.mkdir(parents=True, exist_ok=True)
 
-        content_bytes = base64.b64decode(event['content'])
+        content_bytes = as_bytes(event['content'])
 
         event_path.write_bytes(content_bytes)
+        written_files.record(event_path)
+        file_index.update(event_path)
+
+    def on_chunk(self, event: FileChunk):
+        event_path = str_to_path(event['path'])
+
+        complain_if_not_in_cwd(event_path)
+
+        return self.incoming.on_chunk(event_path, event)
+
+    def on_bundle(self, event: FileBundle):
+        return unpack(event)
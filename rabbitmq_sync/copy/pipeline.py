@@ -0,0 +1,161 @@
+import logging
+import queue
+import socket
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from threading import Thread, Lock, BoundedSemaphore
+from typing import Iterable
+
+from kombu import Connection, Producer
+from rabbitmq_sync import definitions, compression, codec
+from rabbitmq_sync.utils.throttle import TokenBucket
+from .bundle import pack
+from .config import READ_WORKERS, QUEUE_SIZE, CONFIRM_WINDOW, BANDWIDTH_LIMIT, BUNDLE_FILE_SIZE, BUNDLE_SIZE
+from .transfer import iter_chunks
+
+
+class ConfirmWindow:
+    """Limits the number of published messages the broker has not confirmed yet"""
+
+    def __init__(self, connection: Connection, channel, size: int):
+        self.connection = connection
+        self.size = size
+        self.delivery_tag = 0
+        self.unconfirmed = set()
+
+        # transports without publisher confirms (e.g. memory) publish without a window
+        self.enabled = size > 0 and hasattr(channel, 'confirm_select')
+        if self.enabled:
+            channel.confirm_select()
+            channel.events['basic_ack'].add(self.on_ack)
+            channel.events['basic_nack'].add(self.on_nack)
+
+    def on_published(self):
+        if self.enabled:
+            self.delivery_tag += 1
+            self.unconfirmed.add(self.delivery_tag)
+
+    def on_ack(self, delivery_tag: int, multiple: bool):
+        if multiple:
+            self.unconfirmed = {tag for tag in self.unconfirmed if tag > delivery_tag}
+        else:
+            self.unconfirmed.discard(delivery_tag)
+
+    def on_nack(self, delivery_tag: int, multiple: bool):
+        logging.error('Broker rejected copy message %s', delivery_tag)
+        self.on_ack(delivery_tag, multiple)
+
+    def wait(self, limit: int):
+        while self.enabled and len(self.unconfirmed) > limit:
+            try:
+                self.connection.drain_events(timeout=1)
+            except socket.timeout:
+                pass
+
+    def wait_for_slot(self):
+        self.wait(self.size - 1)
+
+    def wait_all(self):
+        self.wait(0)
+
+
+class CopyPipeline:
+    """
+    Reads files on a thread pool and publishes their chunks from a single publisher thread.
+    A bounded queue between the two stops readers when the publisher falls behind,
+    the publisher itself is held back by publisher confirms and the bandwidth limit.
+    Small files are packed together into compressed bundles instead of being sent one by one.
+    """
+
+    def __init__(self, connection: Connection):
+        self.connection = connection
+        self.readers = ThreadPoolExecutor(max_workers=READ_WORKERS, thread_name_prefix='copy-reader')
+        # stops the feeder from walking far ahead of the readers
+        self.reader_slots = BoundedSemaphore(READ_WORKERS * 2)
+        self.messages = queue.Queue(maxsize=QUEUE_SIZE)
+        self.bandwidth = TokenBucket(BANDWIDTH_LIMIT)
+        self.publisher = None
+        self.lock = Lock()
+
+    def send(self, paths: Iterable[Path]):
+        """Returns right away, paths are iterated on a separate thread"""
+        self.start_publisher()
+        Thread(target=self.feed, args=(paths,), daemon=True).start()
+
+    def feed(self, paths: Iterable[Path]):
+        small_paths = []
+        small_size = 0
+
+        for path in paths:
+            try:
+                size = path.stat().st_size
+            except OSError:
+                logging.exception('Could not read %s', path)
+                continue
+
+            if size >= BUNDLE_FILE_SIZE:
+                self.submit(self.read, path)
+                continue
+
+            small_paths.append(path)
+            small_size += size
+            if small_size >= BUNDLE_SIZE:
+                self.submit(self.read_bundle, small_paths)
+                small_paths = []
+                small_size = 0
+
+        if len(small_paths) == 1:
+            self.submit(self.read, small_paths[0])
+        elif small_paths:
+            self.submit(self.read_bundle, small_paths)
+
+    def submit(self, func, *args):
+        self.reader_slots.acquire()
+        self.readers.submit(func, *args)
+
+    def read(self, path: Path):
+        try:
+            for chunk in iter_chunks(path):
+                self.messages.put(chunk)
+        except OSError:
+            logging.exception('Could not read %s', path)
+        finally:
+            self.reader_slots.release()
+
+    def read_bundle(self, paths: list[Path]):
+        try:
+            self.messages.put(pack(paths))
+        except OSError:
+            logging.exception('Could not bundle %s files', len(paths))
+        finally:
+            self.reader_slots.release()
+
+    def start_publisher(self):
+        with self.lock:
+            if self.publisher is None or not self.publisher.is_alive():
+                self.publisher = Thread(target=self.run_publisher, daemon=True)
+                self.publisher.start()
+
+    def run_publisher(self):
+        # channels are not thread safe, the publisher thread gets its own connection
+        with self.connection.clone() as connection:
+            channel = connection.channel()
+            window = ConfirmWindow(connection, channel, CONFIRM_WINDOW)
+            producer = Producer(channel, exchange=definitions.main_exchange)
+
+            while True:
+                try:
+                    message = self.messages.get(timeout=1)
+                except queue.Empty:
+                    window.wait_all()
+                    continue
+
+                self.bandwidth.consume(len(message['content']))
+                window.wait_for_slot()
+
+                producer.publish(message,
+                                 routing_key='event.copy',
+                                 headers={'client_id': definitions.client_id},
+                                 serializer=codec.negotiated(),
+                                 compression=compression.for_event(message))
+                window.on_published()
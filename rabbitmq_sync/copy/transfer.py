@@ -0,0 +1,129 @@
+import logging
+import os
+import time
+import uuid
+from pathlib import Path
+from typing import Iterator
+
+from rabbitmq_sync.codec import as_bytes
+from rabbitmq_sync.filesystem.echo import written_files
+from rabbitmq_sync.filesystem.index import file_index
+from rabbitmq_sync.utils.hashing import new_hash, file_hash
+from .config import CHUNK_SIZE, PART_POSTFIX, TRANSFER_TIMEOUT_SECONDS
+from .events import FileChunk, EVENT_TYPE_CHUNK
+
+
+def iter_chunks(path: Path, chunk_size: int = CHUNK_SIZE) -> Iterator[FileChunk]:
+    """Read a file from disk one chunk at a time, the last chunk carries the checksum"""
+    transfer_id = str(uuid.uuid4())
+    total_size = path.stat().st_size
+    checksum = new_hash()
+
+    with open(path, 'rb') as f:
+        seq = 0
+        offset = 0
+        block = f.read(min(chunk_size, total_size))
+
+        while True:
+            checksum.update(block)
+            next_offset = offset + len(block)
+            # the file can change while it is read, never send more than was announced
+            next_block = f.read(min(chunk_size, total_size - next_offset)) if block else b''
+
+            chunk: FileChunk = {
+                'event_type': EVENT_TYPE_CHUNK,
+                'path': path.as_posix(),
+                'transfer_id': transfer_id,
+                'seq': seq,
+                'offset': offset,
+                'total_size': total_size,
+                'content': block,
+            }
+
+            if not next_block:
+                chunk['total_size'] = next_offset
+                chunk['checksum'] = checksum.hexdigest()
+                yield chunk
+                return
+
+            yield chunk
+
+            seq += 1
+            offset = next_offset
+            block = next_block
+
+
+class IncomingFile:
+    def __init__(self, path: Path, transfer_id: str):
+        self.path = path
+        self.part_path = path.with_name(f'.{path.name}.{transfer_id[:8]}{PART_POSTFIX}')
+        self.received_seq = set()
+        self.received_bytes = 0
+        self.total_size = None
+        self.checksum = None
+        self.updated_on = time.time()
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.file = open(self.part_path, 'wb')
+
+    def write(self, chunk: FileChunk) -> bool:
+        """Write chunk at its offset, returns True when the whole file was received"""
+        self.updated_on = time.time()
+
+        if chunk['seq'] not in self.received_seq:
+            content = as_bytes(chunk['content'])
+            self.file.seek(chunk['offset'])
+            self.file.write(content)
+            self.received_seq.add(chunk['seq'])
+            self.received_bytes += len(content)
+
+        if 'checksum' in chunk:
+            self.total_size = chunk['total_size']
+            self.checksum = chunk['checksum']
+
+        return self.checksum is not None and self.received_bytes >= self.total_size
+
+    def complete(self) -> bool:
+        self.file.close()
+
+        if self.received_bytes != self.total_size or file_hash(self.part_path) != self.checksum:
+            logging.error('Checksum mismatch for %s, dropping transfer', self.path)
+            self.part_path.unlink(missing_ok=True)
+            return False
+
+        os.replace(self.part_path, self.path)
+        written_files.record(self.path, self.checksum)
+        file_index.update(self.path, self.checksum)
+        return True
+
+    def abort(self):
+        self.file.close()
+        self.part_path.unlink(missing_ok=True)
+
+
+class IncomingTransfers:
+    def __init__(self):
+        self.transfers: dict[str, IncomingFile] = dict()
+
+    def on_chunk(self, path: Path, chunk: FileChunk) -> bool:
+        """Returns True when the chunk completed a file at path"""
+        self.drop_stale()
+
+        transfer_id = chunk['transfer_id']
+        incoming = self.transfers.get(transfer_id)
+        if incoming is None:
+            incoming = self.transfers[transfer_id] = IncomingFile(path, transfer_id)
+
+        if not incoming.write(chunk):
+            return False
+
+        del self.transfers[transfer_id]
+        return incoming.complete()
+
+    def drop_stale(self):
+        now = time.time()
+        for transfer_id, incoming in list(self.transfers.items()):
+            if now - incoming.updated_on > TRANSFER_TIMEOUT_SECONDS:
+                logging.warning('Transfer of %s timed out', incoming.path)
+                incoming.abort()
+                del self.transfers[transfer_id]
@@ -13,7 +13,25 @@ negation_exchange = Exchange(
         'alternate-exchange': f'sync-client-{client_id}'
     })
 
-client_exchange = Exchange(f'sync-client-{client_id}', 'topic', auto_delete=True)
+
+def peer_exchange(peer_id: str) -> Exchange:
+    """Exchange that delivers to one client only"""
+    return Exchange(f'sync-client-{peer_id}', 'topic', auto_delete=True)
+
+
+def peer_connected(channel, peer_id: str) -> bool:
+    """
+    Whether the exchange of a peer still exists, the broker removes it with the peer's queue when the peer leaves.
+    Declaring it again would keep messages for nobody, publishing to a missing one closes the channel.
+    """
+    try:
+        peer_exchange(peer_id).declare(passive=True, channel=channel)
+    except channel.connection.client.channel_errors:
+        return False
+    return True
+
+
+client_exchange = peer_exchange(client_id)
 main_queue = Queue(f'q-sync-{client_id}', exchange=client_exchange, routing_key='#', auto_delete=True)
 
 
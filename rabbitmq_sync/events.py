@@ -1,13 +1,44 @@
 from typing import TypedDict, Optional
+from typing_extensions import NotRequired
 
 EVENT_TYPE_PING = 'ping'
 EVENT_TYPE_PONG = 'pong'
 EVENT_INTERNAL_READY = 'ready'
+# handler entries the worker calls itself instead of dispatching events to them:
+# fields to add to ping and pong, queues to consume besides the main queue
+# and how many unacknowledged messages of those queues the broker hands to this client at once
+EVENT_INTERNAL_ADVERTISE = 'advertise'
+EVENT_INTERNAL_QUEUES = 'queues'
+EVENT_INTERNAL_PREFETCH = 'prefetch'
+# dispatched with the client_id of a client that was not heard from for settings.PEER_TIMEOUT_SECONDS
+EVENT_INTERNAL_PEER_GONE = 'peer_gone'
+# never dispatched for received messages, whatever their event_type
+INTERNAL_HOOKS = {
+    EVENT_INTERNAL_READY,
+    EVENT_INTERNAL_ADVERTISE,
+    EVENT_INTERNAL_QUEUES,
+    EVENT_INTERNAL_PREFETCH,
+    EVENT_INTERNAL_PEER_GONE,
+}
 
 
 class BaseEvent(TypedDict):
     event_type: str
+    # sender, filled in from message headers on receive
+    client_id: NotRequired[str]
+    # set when the broker delivered the message before, e.g. after it was requeued
+    redelivered: NotRequired[bool]
+
+
+class Requeue(Exception):
+    """Raised by a handler that cannot take the event now, the message goes back to its queue for another consumer"""
 
 
 class PingPong(BaseEvent):
     pong: bool
+    # compression codecs the client can decompress
+    encodings: NotRequired[list[str]]
+    # serializers the client can read besides json
+    serializers: NotRequired[list[str]]
+    # url prefixes the client proxies http requests for, see http.routing
+    http_prefixes: NotRequired[list[str]]
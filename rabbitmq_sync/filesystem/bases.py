@@ -0,0 +1,103 @@
+import logging
+import os
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+from typing import Optional
+
+from rabbitmq_sync.utils.hashing import bytes_hash
+from .config import SYNC_DIR, BASE_DIR, BASE_STORE_SIZE
+from .index import FileIndex, file_index
+from .utils import cwd
+
+
+class BaseStore:
+    """
+    Last synchronized version of text files, the common ancestor for three-way merges.
+    Contents are stored once per hash and evicted least recently used first when the store grows over max_size,
+    the index maps paths to hashes.
+    """
+
+    def __init__(self, root: Path, index: FileIndex, max_size: int = BASE_STORE_SIZE):
+        self.root = root
+        self.index = index
+        self.max_size = max_size
+        # hash -> size, least recently used first
+        self.sizes: Optional[OrderedDict[str, int]] = None
+        self.lock = Lock()
+
+    def load(self) -> OrderedDict[str, int]:
+        if self.sizes is None:
+            stats = []
+            if self.root.exists():
+                for blob in self.root.glob('*/*'):
+                    if blob.suffix:
+                        # interrupted write
+                        blob.unlink(missing_ok=True)
+                        continue
+                    stat = blob.stat()
+                    stats.append((stat.st_mtime_ns, blob.name, stat.st_size))
+            self.sizes = OrderedDict((name, size) for _, name, size in sorted(stats))
+        return self.sizes
+
+    def blob_path(self, content_hash: str) -> Path:
+        return self.root / content_hash[:2] / content_hash
+
+    def put(self, content: bytes) -> str:
+        content_hash = bytes_hash(content)
+        path = self.blob_path(content_hash)
+
+        with self.lock:
+            sizes = self.load()
+            if content_hash in sizes:
+                sizes.move_to_end(content_hash)
+                os.utime(path)
+                return content_hash
+
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix('.tmp')
+            tmp_path.write_bytes(content)
+            os.replace(tmp_path, path)
+            sizes[content_hash] = len(content)
+            self.evict()
+
+        return content_hash
+
+    def has(self, content_hash: str) -> bool:
+        with self.lock:
+            return content_hash in self.load()
+
+    def get(self, content_hash: str) -> Optional[bytes]:
+        path = self.blob_path(content_hash)
+        with self.lock:
+            sizes = self.load()
+            if content_hash not in sizes:
+                return None
+            try:
+                content = path.read_bytes()
+            except FileNotFoundError:
+                del sizes[content_hash]
+                return None
+            sizes.move_to_end(content_hash)
+            os.utime(path)
+        return content
+
+    def evict(self):
+        total = sum(self.sizes.values())
+        # the newest blob stays even if it alone is over the limit
+        while total > self.max_size and len(self.sizes) > 1:
+            content_hash, size = self.sizes.popitem(last=False)
+            self.blob_path(content_hash).unlink(missing_ok=True)
+            total -= size
+            logging.debug('Evicted base %s', content_hash)
+
+    def record(self, path: Path | str, content: bytes):
+        """Remember content as the last synchronized version of path"""
+        self.index.set_base_hash(path, self.put(content))
+
+    def base_of(self, path: Path | str) -> Optional[bytes]:
+        content_hash = self.index.base_hash(path)
+        return self.get(content_hash) if content_hash is not None else None
+
+
+base_store = BaseStore(cwd / SYNC_DIR / BASE_DIR, file_index)
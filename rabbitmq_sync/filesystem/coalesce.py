@@ -0,0 +1,124 @@
+import logging
+import os
+import time
+from threading import Thread, Condition
+from typing import Callable, Optional
+
+from .config import QUIET_WINDOW_SECONDS, MAX_DELAY_SECONDS, MAX_BATCH_SIZE
+from .events import *
+
+IGNORED_EVENT_TYPES = {EVENT_TYPE_OPENED, EVENT_TYPE_CLOSED, EVENT_TYPE_CLOSED_NO_WRITE}
+
+
+def merge(old: FileSystemEvent, new: FileSystemEvent) -> Optional[FileSystemEvent]:
+    """Net effect of two events on the same path, None if they cancel out"""
+    old_type, new_type = old['event_type'], new['event_type']
+
+    if old_type == EVENT_TYPE_CREATED and new_type == EVENT_TYPE_DELETED:
+        return None
+    if old_type == EVENT_TYPE_CREATED and new_type == EVENT_TYPE_MODIFIED:
+        return {**new, 'event_type': EVENT_TYPE_CREATED}
+    if old_type == EVENT_TYPE_DELETED and new_type in (EVENT_TYPE_CREATED, EVENT_TYPE_MODIFIED):
+        return {**new, 'event_type': EVENT_TYPE_MODIFIED}
+    return new
+
+
+class EventCoalescer:
+    """
+    Collects watcher events and publishes one net event per path
+    once no new events came for QUIET_WINDOW_SECONDS.
+    """
+
+    def __init__(self, publish: Callable[[list[FileSystemEvent]], None]):
+        self.publish = publish
+        # dicts keep insertion order, a path moves to the end when it gets a new event
+        self.pending: dict[str, FileSystemEvent] = dict()
+        self.first_event_on = None
+        self.last_event_on = None
+        self.condition = Condition()
+
+        Thread(target=self.run, daemon=True).start()
+
+    def add(self, event: FileSystemEvent):
+        if event['event_type'] in IGNORED_EVENT_TYPES:
+            return
+        # directories are modified whenever their content changes, the content has its own events
+        if event['is_directory'] and event['event_type'] == EVENT_TYPE_MODIFIED:
+            return
+
+        with self.condition:
+            if event['event_type'] == EVENT_TYPE_MOVED:
+                self.add_moved(event)
+            else:
+                self.add_event(event['src_path'], event)
+
+            now = time.monotonic()
+            self.first_event_on = self.first_event_on or now
+            self.last_event_on = now
+            self.condition.notify()
+
+    def add_event(self, path: str, event: FileSystemEvent):
+        old = self.pending.pop(path, None)
+        merged = merge(old, event) if old is not None else event
+        if merged is not None:
+            self.pending[path] = merged
+
+    def add_moved(self, event: FileSystemEvent):
+        src_path, dest_path = event['src_path'], event['dest_path']
+        if self.is_part_of_directory_move(src_path, dest_path):
+            return
+
+        old = self.pending.pop(src_path, None)
+
+        # file created and renamed right away (atomic saves): the other side only needs the result
+        if old is not None and old['event_type'] == EVENT_TYPE_CREATED:
+            created: FileSystemEvent = {key: value for key, value in event.items() if key != 'dest_path'}
+            created.update(event_type=EVENT_TYPE_CREATED, src_path=dest_path)
+            self.add_event(dest_path, created)
+            return
+
+        # whatever happened to the destination is overwritten by the move
+        self.pending.pop(dest_path, None)
+        self.pending[src_path] = event
+
+    def is_part_of_directory_move(self, src_path: str, dest_path: str) -> bool:
+        """Watchdog follows a directory move with moves of everything inside it"""
+        parent = os.path.dirname(src_path)
+        while parent:
+            moved = self.pending.get(parent)
+            if moved is not None and moved['event_type'] == EVENT_TYPE_MOVED and moved['is_directory']:
+                return dest_path == os.path.join(moved['dest_path'], os.path.relpath(src_path, parent))
+            parent = os.path.dirname(parent)
+        return False
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.is_ready():
+                    self.condition.wait(timeout=self.wait_time())
+
+                events = list(self.pending.values())
+                self.pending.clear()
+                self.first_event_on = self.last_event_on = None
+
+            for start in range(0, len(events), MAX_BATCH_SIZE):
+                try:
+                    self.publish(events[start:start + MAX_BATCH_SIZE])
+                except Exception:
+                    logging.exception('Could not publish %s filesystem events', len(events))
+
+    def is_ready(self) -> bool:
+        if not self.pending:
+            return False
+
+        now = time.monotonic()
+        return now - self.last_event_on >= QUIET_WINDOW_SECONDS or now - self.first_event_on >= MAX_DELAY_SECONDS
+
+    def wait_time(self) -> Optional[float]:
+        if not self.pending:
+            return None
+
+        now = time.monotonic()
+        return max(0., min(
+            self.last_event_on + QUIET_WINDOW_SECONDS - now,
+            self.first_event_on + MAX_DELAY_SECONDS - now))
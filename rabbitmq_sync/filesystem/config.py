@@ -1 +1,41 @@
 DIFF_POSTFIX = '*rabbit-sync-diff*'
+# myers, myers-linear, patience or histogram, see utils.diff_engine
+DIFF_ALGORITHM = 'myers'
+
+# files smaller than this are always sent whole, and larger ones too,
+# deltas are computed byte by byte on the consumer thread at roughly a second per megabyte
+DELTA_MIN_SIZE = 16 * 1024
+DELTA_MAX_SIZE = 1024 * 1024
+# send whole content when a delta would save less than this share of it
+DELTA_MIN_SAVING = 0.25
+
+# larger files, and files with a NUL byte in the first BINARY_SNIFF_SIZE bytes, are never merged line by line
+TEXT_MAX_SIZE = 2 * 1024 * 1024
+BINARY_SNIFF_SIZE = 8 * 1024
+# what to do when binary versions differ: 'newest' keeps the newer one,
+# 'copy' also keeps an incoming older version next to the file, named by its hash
+BINARY_CONFLICT_POLICY = 'newest'
+
+# watcher events for a path are merged until no new events came for this long
+QUIET_WINDOW_SECONDS = 0.3
+# pending events are published after this long even if the filesystem never calms down
+MAX_DELAY_SECONDS = 3.
+# events published in one message
+MAX_BATCH_SIZE = 500
+
+# files written by the sync itself are remembered this long to drop the watcher events they cause
+ECHO_TTL_SECONDS = 10.
+ECHO_CACHE_SIZE = 10000
+
+# local state of the sync, never synchronized itself
+SYNC_DIR = '.rabbit-sync'
+INDEX_FILE = 'index.sqlite'
+# last synchronized versions of text files, used as merge bases and delta references
+BASE_DIR = 'bases'
+BASE_STORE_SIZE = 256 * 1024 * 1024
+# postfix of files that are being received
+PART_POSTFIX = '.rabbit-sync-part'
+
+# .gitignore-style files with paths that are neither watched nor synchronized
+IGNORE_FILES = ['.gitignore', '.rabbitsyncignore']
+DEFAULT_IGNORE_PATTERNS = ['.git/', f'/{SYNC_DIR}/', f'*{PART_POSTFIX}']
@@ -0,0 +1,88 @@
+import dataclasses
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+from typing import Optional
+
+from rabbitmq_sync.utils.hashing import file_hash
+from .config import ECHO_TTL_SECONDS, ECHO_CACHE_SIZE
+from .events import *
+
+
+@dataclasses.dataclass
+class Fingerprint:
+    recorded_on: float
+    # None for removed files
+    size: Optional[int] = None
+    mtime_ns: Optional[int] = None
+    hash: Optional[str] = None
+
+
+class WrittenFiles:
+    """
+    Fingerprints of files the sync wrote itself.
+    The watcher sees those writes like any other, events that still match a fingerprint are echoes.
+    """
+
+    def __init__(self, ttl: float = ECHO_TTL_SECONDS, max_size: int = ECHO_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.fingerprints: OrderedDict[str, Fingerprint] = OrderedDict()
+        self.lock = Lock()
+
+    def record(self, path: Path, content_hash: str = None):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return self.record_removed(path)
+
+        self.put(path, Fingerprint(time.monotonic(), stat.st_size, stat.st_mtime_ns, content_hash))
+
+    def record_removed(self, path: Path):
+        self.put(path, Fingerprint(time.monotonic()))
+
+    def put(self, path: Path, fingerprint: Fingerprint):
+        key = self.key(path)
+        with self.lock:
+            self.fingerprints.pop(key, None)
+            self.fingerprints[key] = fingerprint
+            while len(self.fingerprints) > self.max_size:
+                self.fingerprints.popitem(last=False)
+
+    def get(self, path: Path) -> Optional[Fingerprint]:
+        now = time.monotonic()
+        with self.lock:
+            # oldest first, expired entries are always at the front
+            while self.fingerprints:
+                key, fingerprint = next(iter(self.fingerprints.items()))
+                if now - fingerprint.recorded_on < self.ttl:
+                    break
+                del self.fingerprints[key]
+
+            return self.fingerprints.get(self.key(path))
+
+    def is_echo(self, event: FileSystemEvent) -> bool:
+        path = Path(event.get('dest_path', event['src_path']))
+        fingerprint = self.get(path)
+        if fingerprint is None:
+            return False
+
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return fingerprint.size is None
+
+        if fingerprint.size != stat.st_size:
+            return False
+        if fingerprint.mtime_ns == stat.st_mtime_ns:
+            return True
+        return fingerprint.hash is not None and fingerprint.hash == file_hash(path)
+
+    @staticmethod
+    def key(path: Path) -> str:
+        return os.path.normpath(path)
+
+
+written_files = WrittenFiles()
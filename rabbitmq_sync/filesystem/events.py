@@ -2,6 +2,7 @@ from typing import TypedDict, Optional, Union
 from typing_extensions import NotRequired
 
 from rabbitmq_sync.events import BaseEvent
+from rabbitmq_sync.utils.delta import Signature, DeltaOp
 
 # TYPES
 
@@ -10,11 +11,16 @@ from watchdog.events import (
     EVENT_TYPE_MODIFIED,
     EVENT_TYPE_CREATED,
     EVENT_TYPE_MOVED,
-    EVENT_TYPE_CLOSED
+    EVENT_TYPE_CLOSED,
+    EVENT_TYPE_CLOSED_NO_WRITE,
+    EVENT_TYPE_OPENED,
 )
 
 EVENT_TYPE_CONTENT = 'content'
 EVENT_TYPE_CONTENT_REQUEST = 'content_request'
+EVENT_TYPE_BATCH = 'batch'
+EVENT_TYPE_TREE = 'tree'
+EVENT_TYPE_TREE_REQUEST = 'tree_request'
 
 
 # EVENTS
@@ -29,19 +35,50 @@ class BaseFileEvent(BaseEvent):
 class FileSystemEvent(BaseFileEvent):
     is_directory: bool
     dest_path: NotRequired[str]
+    # content hash and size of files, for moves of the moved file
+    hash: NotRequired[str]
+    size: NotRequired[int]
+
+
+class FileSystemEventBatch(BaseEvent):
+    events: list[FileSystemEvent]
 
 
 class FileContent(BaseFileEvent):
-    content: bytes | str
+    # either full content or a delta against the version with base_hash, the receiver's file or merge base,
+    # sent as bytes, only text files going out as json are sent as str
+    content: NotRequired[bytes | str]
+    # content is bytes, json carries it as a base64 string that must not be taken for text
+    binary: NotRequired[bool]
+    # hash of the full content
+    hash: NotRequired[str]
+    delta: NotRequired[list[DeltaOp]]
+    block_size: NotRequired[int]
+    base_hash: NotRequired[str]
 
 
 class FileContentRequest(BaseFileEvent):
-    pass
+    # hash and size of the local version, nothing is sent back when the other side has the same
+    base_hash: NotRequired[str]
+    size: NotRequired[int]
+    # signature of the local version, lets the other side answer with a delta
+    signature: NotRequired[Signature]
+    # hash of the merge base the requester keeps, the other side can answer with a delta against it too
+    base_version: NotRequired[str]
+
+
+class TreeEntry(TypedDict):
+    hash: str
+    is_directory: bool
+    size: int
 
 
 class TreeRequest(BaseEvent):
-    include_content: bool
+    path: str
+    # manifest hash of path on the requesting side, empty if it does not exist there
+    hash: str
+    requester: str
 
 
-class Tree(BaseEvent):
-    content: dict[str, Union[FileContent]]
+class Tree(TreeRequest):
+    entries: dict[str, TreeEntry]
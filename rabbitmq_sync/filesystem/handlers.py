@@ -1,13 +1,44 @@
+import logging
+import os
 import time
 from functools import wraps
+from typing import Iterable
 
+from pathlib import Path
 from kombu import Connection, Producer
 from kombu.pools import producers
 from .events import *
-from .utils import path_edited_on, str_to_path, complain_if_not_in_cwd
-from .config import DIFF_POSTFIX
-from rabbitmq_sync.utils import git_diff_resolve
-from rabbitmq_sync import definitions
+from .utils import path_edited_on, str_to_path, complain_if_not_in_cwd, write_atomic
+from .echo import written_files
+from .index import file_index
+from .bases import base_store
+from .config import (
+    DIFF_POSTFIX,
+    DIFF_ALGORITHM,
+    DELTA_MIN_SIZE,
+    DELTA_MAX_SIZE,
+    DELTA_MIN_SAVING,
+    TEXT_MAX_SIZE,
+    BINARY_SNIFF_SIZE,
+    BINARY_CONFLICT_POLICY,
+)
+from rabbitmq_sync.utils import bytes_hash, read_with_hash
+from rabbitmq_sync.utils.diff import iter_git_diff_resolve
+from rabbitmq_sync.utils.merge import iter_merge3
+from rabbitmq_sync.utils.delta import signature, delta, patch, literal_size
+from rabbitmq_sync import definitions, compression, codec
+from rabbitmq_sync.codec import as_bytes
+
+
+def is_text(content: bytes) -> bool:
+    """Whether content is small enough and looks like text, anything else is handled as opaque bytes"""
+    if len(content) > TEXT_MAX_SIZE or b'\0' in content[:BINARY_SNIFF_SIZE]:
+        return False
+    try:
+        content.decode('utf-8')
+    except UnicodeDecodeError:
+        return False
+    return True
 
 
 def register(connection: Connection):
@@ -16,18 +47,34 @@ def register(connection: Connection):
     def wrap_check(func):
         @wraps(func)
         def wrapper(event: BaseFileEvent):
-            event_path = str_to_path(event['src_path'])
-            complain_if_not_in_cwd(event_path)
+            for key in ('src_path', 'dest_path'):
+                if key in event:
+                    complain_if_not_in_cwd(str_to_path(event[key]))
             func(event)
 
         return wrapper
 
-    return {
+    handlers = {
         EVENT_TYPE_MODIFIED: wrap_check(handler.on_modified),
+        EVENT_TYPE_CREATED: wrap_check(handler.on_created),
+        EVENT_TYPE_DELETED: wrap_check(handler.on_deleted),
+        EVENT_TYPE_MOVED: wrap_check(handler.on_moved),
         EVENT_TYPE_CONTENT_REQUEST: wrap_check(handler.on_content_request),
         EVENT_TYPE_CONTENT: wrap_check(handler.on_content),
     }
 
+    def on_batch(batch: FileSystemEventBatch):
+        for event in batch['events']:
+            if 'client_id' in batch:
+                event['client_id'] = batch['client_id']
+            handler_func = handlers.get(event['event_type'])
+            if handler_func is not None:
+                handler_func(event)
+
+    handlers[EVENT_TYPE_BATCH] = on_batch
+
+    return handlers
+
 
 class FileSystemEventHandler:
     def __init__(self, connection: Connection):
@@ -37,72 +84,332 @@ class FileSystemEventHandler:
         if event['is_directory']:
             return
 
+        event_path = str_to_path(event['src_path'])
+        if 'hash' in event and file_index.hash(event_path) == event['hash']:
+            # same bytes here already, e.g. only the mtime changed
+            return
+
         if self.is_event_newer(event):
             request: FileContentRequest = {
                 'event_type': EVENT_TYPE_CONTENT_REQUEST,
                 'src_path': event['src_path'],
                 'timestamp': time.time(),
             }
-            self.publish(request)
+
+            try:
+                local_content, request['base_hash'] = read_with_hash(event_path)
+                request['size'] = len(local_content)
+            except FileNotFoundError:
+                local_content = b''
+
+            if DELTA_MIN_SIZE <= len(local_content) <= DELTA_MAX_SIZE:
+                request['signature'] = signature(local_content)
+
+            base_version = file_index.base_hash(event_path)
+            if base_version is not None and base_store.has(base_version):
+                request['base_version'] = base_version
+
+            # only the client that changed the file answers
+            self.publish(request, to=event.get('client_id'))
+
+    def on_created(self, event: FileSystemEvent):
+        if not event['is_directory']:
+            return self.on_modified(event)
+
+        event_path = str_to_path(event['src_path'])
+        event_path.mkdir(parents=True, exist_ok=True)
+        written_files.record(event_path)
+
+    def on_deleted(self, event: FileSystemEvent):
+        event_path = str_to_path(event['src_path'])
+
+        if not event_path.exists():
+            return
+
+        if event_path.is_dir() and not event_path.is_symlink():
+            # the mtime of a directory says nothing about the files in it, each is checked on its own
+            self.delete_directory(event_path, self.event_edited_on(event))
+            return
+
+        # edited here after it was deleted there
+        if not self.is_event_newer(event):
+            return
+
+        event_path.unlink()
+        written_files.record_removed(event_path)
+        file_index.remove(event_path)
+
+    def delete_directory(self, path: Path, deleted_on: float) -> bool:
+        """Deletes what was not edited after deleted_on, returns whether the directory is gone"""
+        kept = False
+        for child in path.iterdir():
+            if child.is_dir() and not child.is_symlink():
+                kept = not self.delete_directory(child, deleted_on) or kept
+            elif path_edited_on(child) < deleted_on:
+                child.unlink()
+                written_files.record_removed(child)
+                file_index.remove(child)
+            else:
+                kept = True
+
+        if kept:
+            logging.info('Keeping %s, files in it were edited here after it was deleted there', path)
+            return False
+
+        path.rmdir()
+        written_files.record_removed(path)
+        file_index.remove(path)
+        return True
+
+    def on_moved(self, event: FileSystemEvent):
+        src_path = str_to_path(event['src_path'])
+        dest_path = str_to_path(event['dest_path'])
+
+        if event['is_directory']:
+            return self.move_directory(src_path, dest_path)
+
+        event_hash = event.get('hash')
+        if event_hash is not None and file_index.hash(dest_path) == event_hash:
+            # already there, e.g. the same rename happened here too
+            if file_index.hash(src_path) == event_hash:
+                src_path.unlink()
+                written_files.record_removed(src_path)
+                file_index.remove(src_path)
+            return
+
+        if src_path.is_file():
+            if dest_path.exists() and not self.is_event_newer(event, dest_path):
+                # the file moved over was edited here after the move there, the follow-up request skips it too
+                logging.info('Not moving %s, %s was edited here after it was moved there', src_path, dest_path)
+            else:
+                self.rename(src_path, dest_path)
+
+        if event_hash is None or file_index.hash(dest_path) != event_hash:
+            # local copy differs from the moved file or there is none, ask for its content
+            self.on_modified({**event, 'event_type': EVENT_TYPE_MODIFIED, 'src_path': event['dest_path']})
+
+    def move_directory(self, src_path: Path, dest_path: Path):
+        if not src_path.is_dir():
+            logging.info('Not moving %s, it does not exist here', src_path)
+            return
+        if dest_path.exists():
+            logging.info('Not moving %s, %s already exists', src_path, dest_path)
+            return
+
+        self.rename(src_path, dest_path)
+
+    @staticmethod
+    def rename(src_path: Path, dest_path: Path):
+        dest_path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(src_path, dest_path)
+
+        written_files.record_removed(src_path)
+        written_files.record(dest_path)
+        file_index.move(src_path, dest_path)
 
     def on_content_request(self, event: FileContentRequest):
         event_path = str_to_path(event['src_path'])
+        try:
+            content, content_hash = read_with_hash(event_path)
+        except FileNotFoundError:
+            # removed since, its deleted event follows
+            logging.info('Not answering content request for %s, it no longer exists', event_path)
+            return
+
+        if event.get('base_hash') == content_hash:
+            # the requester has these bytes already
+            return
 
         response: FileContent = {
             'event_type': EVENT_TYPE_CONTENT,
             'src_path': str(event_path),
-            'content': event_path.read_text(),
             'edited_on': path_edited_on(event_path),
             'timestamp': time.time(),
+            'hash': content_hash,
         }
 
-        self.publish(response)
+        text = is_text(content)
+        best = self.best_delta(content, event)
+        if best is not None:
+            response['delta'], response['block_size'], response['base_hash'] = best
+        elif text and codec.negotiated(event.get('client_id')) == codec.JSON_NAME:
+            # json would base64 bytes, text goes as it is
+            response['content'] = content.decode('utf-8')
+        else:
+            response['content'] = content
+            response['binary'] = True
+
+        if text:
+            # the requester is going to have this version too
+            base_store.record(event_path, content)
+
+        self.publish(response, to=event.get('client_id'))
+
+    @staticmethod
+    def best_delta(content: bytes, event: FileContentRequest) -> Optional[tuple[list[DeltaOp], int, str]]:
+        """Smallest delta against the requester's file or merge base, None if sending everything is about as cheap"""
+        if not DELTA_MIN_SIZE <= len(content) <= DELTA_MAX_SIZE:
+            return None
+
+        candidates = []
+        if 'signature' in event:
+            candidates.append((event['signature'], event['base_hash']))
+        if 'base_version' in event:
+            base_content = base_store.get(event['base_version'])
+            if base_content is not None:
+                candidates.append((signature(base_content), event['base_version']))
+
+        best = None
+        for base_signature, base_hash in candidates:
+            ops = delta(content, base_signature)
+            if best is None or literal_size(ops) < literal_size(best[0]):
+                best = ops, base_signature['block_size'], base_hash
+
+        if best is None or literal_size(best[0]) >= len(content) * (1 - DELTA_MIN_SAVING):
+            return None
+        return best
 
     def on_content(self, event: FileContent):
+        if 'src_path' not in event:
+            # whole file sent by the copy handler of an older client, see copy.handler
+            return
+
         event_path = str_to_path(event['src_path'])
-        event_content = event['content']
-        try:
-            local_content = event_path.read_text()
-        except FileNotFoundError:
-            local_content = ''
+
+        event_content = None
+        if 'content' in event:
+            event_content = event['content']
+            if isinstance(event_content, str) and not event.get('binary'):
+                event_content = event_content.encode()
+            else:
+                event_content = bytes(as_bytes(event_content))
+
+        event_hash = event.get('hash')
+        if event_hash is None and event_content is not None:
+            event_hash = bytes_hash(event_content)
+
+        # equal content needs neither reading nor writing the local file
+        if event_hash is not None and file_index.hash(event_path) == event_hash:
+            return
+
+        local_content = self.read_local(event_path)
+
+        if event_content is None:
+            if bytes_hash(local_content) == event['base_hash']:
+                reference = local_content
+            else:
+                reference = base_store.get(event['base_hash'])
+            if reference is None:
+                # local file changed since it was requested, its own modified event will follow
+                logging.info('Dropping delta for %s, local version differs from its base', event_path)
+                return
+            event_content = patch(reference, event['block_size'], event['delta'])
+            if event_hash is not None and bytes_hash(event_content) != event_hash:
+                # the reference is not what the delta was computed against, e.g. a weak hash collision
+                logging.warning('Delta for %s does not apply, requesting the whole file', event_path)
+                request: FileContentRequest = {
+                    'event_type': EVENT_TYPE_CONTENT_REQUEST,
+                    'src_path': event['src_path'],
+                    'timestamp': time.time(),
+                }
+                self.publish(request, to=event.get('client_id'))
+                return
 
         if local_content == event_content:
             return
 
+        if is_text(local_content) and is_text(event_content):
+            self.merge_text(event_path, local_content.decode('utf-8'), event_content.decode('utf-8'), event)
+        else:
+            self.resolve_binary(event_path, local_content, event_content, event)
+
+    def merge_text(self, event_path: Path, local_content: str, event_content: str, event: FileContent):
         if self.has_diff(local_content) != self.has_diff(event_content):
             return
 
-        take_event_diff = self.is_event_newer(event)
+        base = base_store.base_of(event_path)
+        if base is not None and is_text(base):
+            new_content = iter_merge3(
+                base.decode('utf-8'),
+                local_content,
+                event_content,
+                diff_postfix=DIFF_POSTFIX,
+                algorithm=DIFF_ALGORITHM)
+        else:
+            # no common version known, first sync or the base was evicted
+            take_event_diff = self.is_event_newer(event)
+
+            new_content = iter_git_diff_resolve(
+                local_content,
+                event_content,
+                auto_resolve='b' if take_event_diff else 'a',
+                diff_postfix=DIFF_POSTFIX,
+                algorithm=DIFF_ALGORITHM)
+
+        self.write(event_path, new_content)
+        base_store.record(event_path, event_content.encode())
+
+    def resolve_binary(self, event_path: Path, local_content: bytes, event_content: bytes, event: FileContent):
+        """Binary and oversized files are never merged, the newer version wins"""
+        if self.is_event_newer(event):
+            self.write(event_path, event_content)
+        elif BINARY_CONFLICT_POLICY == 'copy':
+            copy_path = self.conflict_path(event_path, bytes_hash(event_content))
+            if not copy_path.exists():
+                logging.info('Keeping older version of %s as %s', event_path, copy_path)
+                self.write(copy_path, event_content)
 
-        new_content = git_diff_resolve(
-            local_content,
-            event_content,
-            auto_resolve='b' if take_event_diff else 'a',
-            diff_postfix=DIFF_POSTFIX)
+    @staticmethod
+    def conflict_path(path: Path, content_hash: str) -> Path:
+        return path.with_name(f'{path.stem}.conflict-{content_hash[:8]}{path.suffix}')
 
-        event_path.write_text(new_content)
+    @staticmethod
+    def write(path: Path, content: bytes | Iterable[str]):
+        new_hash = write_atomic(path, [content] if isinstance(content, bytes) else content)
+        written_files.record(path, new_hash)
+        file_index.update(path, new_hash)
+
+    @staticmethod
+    def read_local(path: Path) -> bytes:
+        try:
+            return path.read_bytes()
+        except FileNotFoundError:
+            return b''
 
     @staticmethod
     def has_diff(content: str):
         return DIFF_POSTFIX in content
 
-
     @staticmethod
-    def is_event_newer(event: BaseFileEvent):
-        event_path = str_to_path(event['src_path'])
-        event_timestamp = event['timestamp']
-        event_edited_on = event.get('edited_on')
+    def is_event_newer(event: BaseFileEvent, path: Path = None):
+        """Whether the event happened after the last local edit of path, its src_path by default"""
+        event_path = path if path is not None else str_to_path(event['src_path'])
 
+        # not the index, it is updated when the watcher flushes, seconds after a local write
         local_edit_time = path_edited_on(event_path)
 
+        return FileSystemEventHandler.event_edited_on(event) > local_edit_time
+
+    @staticmethod
+    def event_edited_on(event: BaseFileEvent) -> float:
+        event_edited_on = event.get('edited_on')
         if event_edited_on is not None:
-            return event_edited_on > local_edit_time
-        return event_timestamp > local_edit_time
+            return event_edited_on
+        return event['timestamp']
+
+    def publish(self, content: dict, to: str = None):
+        """Broadcast to every client, or send to one client when its id is known"""
+        exchange = definitions.main_exchange if to is None else definitions.peer_exchange(to)
 
-    def publish(self, content: dict):
         with producers[self.connection].acquire(block=False) as producer:
             producer: Producer
+            if to is not None and not definitions.peer_connected(producer.channel, to):
+                logging.info('Not sending %s for %s, client %s left', content['event_type'], content['src_path'], to)
+                return
+
             producer.publish(content,
-                             exchange=definitions.main_exchange,
+                             exchange=exchange,
                              routing_key='event.file',
-                             headers={'client_id': definitions.client_id})
+                             headers={'client_id': definitions.client_id},
+                             serializer=codec.negotiated(to),
+                             compression=compression.for_event(content))
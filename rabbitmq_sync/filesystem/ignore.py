@@ -0,0 +1,207 @@
+"""
+.gitignore-style ignore rules.
+
+Patterns are compiled once into
+ - a set of plain names (`node_modules`, `.git/`) matched against every path component,
+ - a prefix trie of plain anchored paths (`/build/out`) walked once along the path,
+ - one combined regex for patterns with wildcards.
+Negated patterns (`!keep.txt`) re-include paths matched by other patterns, but like in git
+nothing inside an ignored directory can be re-included.
+"""
+import logging
+import os
+import re
+from pathlib import Path
+from threading import Lock
+from typing import Iterator, Optional
+
+from .config import IGNORE_FILES, DEFAULT_IGNORE_PATTERNS
+from .utils import cwd
+
+WILDCARDS = re.compile(r'[*?\[]')
+TERMINAL = ''
+
+
+def pattern_to_regex(pattern: str) -> str:
+    result = []
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith('**/', i):
+            result.append('(?:.*/)?')
+            i += 3
+        elif pattern.startswith('/**', i) and i + 3 == len(pattern):
+            result.append('/.*')
+            i += 3
+        elif pattern[i] == '*':
+            result.append('[^/]*')
+            i += 1
+        elif pattern[i] == '?':
+            result.append('[^/]')
+            i += 1
+        elif pattern[i] == '[' and ']' in pattern[i + 1:]:
+            end = pattern.index(']', i + 1)
+            group = pattern[i + 1:end]
+            result.append(f'[^{group[1:]}]' if group.startswith('!') else f'[{group}]')
+            i = end + 1
+        else:
+            result.append(re.escape(pattern[i]))
+            i += 1
+    return ''.join(result)
+
+
+class CompiledPatterns:
+    def __init__(self, patterns: list[str]):
+        self.names = set()
+        self.dir_names = set()
+        self.trie = dict()
+        regexes = []
+        dir_regexes = []
+
+        for pattern in patterns:
+            dir_only = pattern.endswith('/')
+            pattern = pattern.rstrip('/')
+            # a slash anywhere but at the end anchors the pattern to the root
+            anchored = '/' in pattern
+            pattern = pattern.lstrip('/')
+            if not pattern:
+                continue
+
+            if WILDCARDS.search(pattern) is None:
+                if anchored:
+                    self.add_to_trie(pattern.split('/'), dir_only)
+                else:
+                    (self.dir_names if dir_only else self.names).add(pattern)
+                continue
+
+            regex = pattern_to_regex(pattern)
+            if not anchored:
+                regex = '(?:.*/)?' + regex
+            (dir_regexes if dir_only else regexes).append(regex)
+
+        self.regex = self.combine(regexes)
+        self.dir_regex = self.combine(dir_regexes)
+
+    def add_to_trie(self, parts: list[str], dir_only: bool):
+        node = self.trie
+        for part in parts:
+            node = node.setdefault(part, dict())
+        # True: only matches directories
+        node[TERMINAL] = node.get(TERMINAL, True) and dir_only
+
+    @staticmethod
+    def combine(regexes: list[str]) -> Optional[re.Pattern]:
+        if not regexes:
+            return None
+        return re.compile('|'.join(f'(?:{regex})' for regex in regexes))
+
+    def trie_matches(self, parts: list[str], is_dir: bool) -> list[bool]:
+        """For every prefix of parts whether some anchored plain pattern matches it"""
+        matches = [False] * len(parts)
+        node = self.trie
+        for i, part in enumerate(parts):
+            node = node.get(part)
+            if node is None:
+                break
+            if TERMINAL in node:
+                matches[i] = not node[TERMINAL] or is_dir or i < len(parts) - 1
+        return matches
+
+    def matches(self, rel_path: str, name: str, is_dir: bool, trie_match: bool = None) -> bool:
+        if trie_match is None:
+            trie_match = self.trie_matches(rel_path.split('/'), is_dir)[-1]
+
+        return trie_match \
+            or name in self.names \
+            or is_dir and name in self.dir_names \
+            or self.regex is not None and self.regex.fullmatch(rel_path) is not None \
+            or is_dir and self.dir_regex is not None and self.dir_regex.fullmatch(rel_path) is not None
+
+
+class IgnoreRules:
+    def __init__(self, root: Path, files: list[str] = IGNORE_FILES, defaults: list[str] = DEFAULT_IGNORE_PATTERNS):
+        self.root = root
+        self.files = files
+        self.defaults = defaults
+        self.ignored: Optional[CompiledPatterns] = None
+        self.negated: Optional[CompiledPatterns] = None
+        self.lock = Lock()
+
+    def reload(self):
+        patterns = list(self.defaults)
+        for file_name in self.files:
+            try:
+                lines = (self.root / file_name).read_text().splitlines()
+            except FileNotFoundError:
+                continue
+
+            for line in lines:
+                line = line.rstrip()
+                if line and not line.startswith('#'):
+                    patterns.append(line.replace('\\#', '#').replace('\\!', '!'))
+
+        ignored = CompiledPatterns([p for p in patterns if not p.startswith('!')])
+        negated = CompiledPatterns([p[1:] for p in patterns if p.startswith('!')])
+
+        with self.lock:
+            self.ignored, self.negated = ignored, negated
+
+        logging.info('Loaded %s ignore patterns', len(patterns))
+
+    def compiled(self) -> tuple[CompiledPatterns, CompiledPatterns]:
+        if self.ignored is None:
+            self.reload()
+        with self.lock:
+            return self.ignored, self.negated
+
+    def is_ignore_file(self, path: Path | str) -> bool:
+        parts = self.to_parts(path)
+        return len(parts) == 1 and parts[0] in self.files
+
+    def is_ignored(self, path: Path | str, is_dir: bool = False) -> bool:
+        """Checks the path and all its parent directories"""
+        ignored, negated = self.compiled()
+        parts = self.to_parts(path)
+        trie_matches = ignored.trie_matches(parts, is_dir)
+
+        for i, name in enumerate(parts):
+            is_last = i == len(parts) - 1
+            component_is_dir = is_dir or not is_last
+            rel_path = '/'.join(parts[:i + 1])
+
+            if ignored.matches(rel_path, name, component_is_dir, trie_matches[i]) \
+                    and not negated.matches(rel_path, name, component_is_dir):
+                return True
+        return False
+
+    def walk(self, top: Path | str = None) -> Iterator[Path]:
+        """Files under top that are not ignored, ignored directories are not entered at all"""
+        top = Path(top if top is not None else self.root)
+
+        if self.is_ignored(top.relative_to(self.root), is_dir=True):
+            return
+
+        for dir_path, dir_names, file_names in os.walk(top):
+            rel_dir = os.path.relpath(dir_path, self.root)
+            rel_dir = '' if rel_dir == '.' else Path(rel_dir).as_posix() + '/'
+
+            # parents were checked already, only the entries themselves are left
+            dir_names[:] = [name for name in dir_names if not self.is_entry_ignored(rel_dir + name, True)]
+
+            for name in file_names:
+                if not self.is_entry_ignored(rel_dir + name, False):
+                    yield Path(dir_path) / name
+
+    def is_entry_ignored(self, rel_path: str, is_dir: bool) -> bool:
+        """Only checks the path itself, for walks that never enter ignored directories"""
+        ignored, negated = self.compiled()
+        name = rel_path.rsplit('/', 1)[-1]
+        return ignored.matches(rel_path, name, is_dir) and not negated.matches(rel_path, name, is_dir)
+
+    def to_parts(self, path: Path | str) -> list[str]:
+        rel_path = Path(os.path.normpath(path))
+        if rel_path.is_absolute():
+            rel_path = rel_path.relative_to(os.path.abspath(self.root))
+        return [part for part in rel_path.as_posix().split('/') if part and part != '.']
+
+
+ignore_rules = IgnoreRules(cwd)
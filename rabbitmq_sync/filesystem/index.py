@@ -0,0 +1,192 @@
+import dataclasses
+import logging
+import os
+import sqlite3
+from pathlib import Path
+from threading import RLock
+from typing import Optional
+
+from rabbitmq_sync.utils.hashing import file_hash
+from .config import SYNC_DIR, INDEX_FILE
+from .ignore import IgnoreRules, ignore_rules
+from .utils import cwd
+
+
+@dataclasses.dataclass
+class IndexEntry:
+    path: str
+    size: int
+    mtime_ns: int
+    inode: int
+    # computed lazily, None until somebody needs it
+    hash: Optional[str] = None
+
+    @property
+    def mtime(self) -> float:
+        return self.mtime_ns / 1e9
+
+    def matches(self, stat: os.stat_result) -> bool:
+        return (self.size, self.mtime_ns, self.inode) == (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+
+
+class FileIndex:
+    """
+    Persistent path -> size, mtime, inode and content hash of files in the synchronized directory.
+    The watcher keeps it current, so handlers can answer freshness and equality questions
+    without stat calls or reading files.
+    """
+
+    def __init__(self, root: Path, db_path: Path, ignore: IgnoreRules):
+        self.root = root
+        self.db_path = db_path
+        self.ignore = ignore
+        self.db: Optional[sqlite3.Connection] = None
+        self.lock = RLock()
+
+    def connect(self) -> sqlite3.Connection:
+        if self.db is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            self.db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self.db.execute('PRAGMA journal_mode=WAL')
+            self.db.execute('PRAGMA synchronous=NORMAL')
+            self.db.execute('''
+                CREATE TABLE IF NOT EXISTS files (
+                    path TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    inode INTEGER NOT NULL,
+                    hash TEXT
+                )''')
+            self.db.execute('''
+                CREATE TABLE IF NOT EXISTS bases (
+                    path TEXT PRIMARY KEY,
+                    hash TEXT NOT NULL
+                )''')
+        return self.db
+
+    def get(self, path: Path | str) -> Optional[IndexEntry]:
+        """Indexed entry without looking at the file"""
+        with self.lock:
+            row = self.connect().execute(
+                'SELECT path, size, mtime_ns, inode, hash FROM files WHERE path = ?',
+                (self.key(path),)).fetchone()
+        return IndexEntry(*row) if row is not None else None
+
+    def entry(self, path: Path | str, stat: os.stat_result = None) -> Optional[IndexEntry]:
+        """Entry checked against the file with a stat call, the hash is only recomputed when the file changed"""
+        try:
+            stat = stat or os.stat(self.root / path)
+        except FileNotFoundError:
+            self.remove(path)
+            return None
+
+        entry = self.get(path)
+        if entry is None or not entry.matches(stat):
+            entry = IndexEntry(self.key(path), stat.st_size, stat.st_mtime_ns, stat.st_ino)
+
+        if entry.hash is None:
+            entry.hash = file_hash(self.root / path)
+            self.put(entry)
+
+        return entry
+
+    def hash(self, path: Path | str) -> Optional[str]:
+        entry = self.entry(path)
+        return entry.hash if entry is not None else None
+
+    def update(self, path: Path | str, content_hash: str = None):
+        """Record the current state of the file, pass content_hash when it is already known"""
+        try:
+            stat = os.stat(self.root / path)
+        except FileNotFoundError:
+            return self.remove(path)
+
+        entry = self.get(path)
+        if content_hash is None and entry is not None and entry.matches(stat):
+            return
+
+        self.put(IndexEntry(self.key(path), stat.st_size, stat.st_mtime_ns, stat.st_ino, content_hash))
+
+    def put(self, entry: IndexEntry):
+        with self.lock:
+            db = self.connect()
+            db.execute(
+                'INSERT OR REPLACE INTO files (path, size, mtime_ns, inode, hash) VALUES (?, ?, ?, ?, ?)',
+                (entry.path, entry.size, entry.mtime_ns, entry.inode, entry.hash))
+            db.commit()
+
+    def remove(self, path: Path | str):
+        """Remove a file or everything under a directory"""
+        key = self.key(path)
+        with self.lock:
+            db = self.connect()
+            for table in ('files', 'bases'):
+                db.execute(
+                    f"DELETE FROM {table} WHERE path = ? OR substr(path, 1, ?) = ?",
+                    (key, len(key) + 1, key + '/'))
+            db.commit()
+
+    def move(self, src_path: Path | str, dest_path: Path | str):
+        """Move entries of a renamed file or directory, keeping hashes of unchanged files"""
+        src_key, dest_key = self.key(src_path), self.key(dest_path)
+        with self.lock:
+            db = self.connect()
+            for table in ('files', 'bases'):
+                db.execute(
+                    f"DELETE FROM {table} WHERE path = ? OR substr(path, 1, ?) = ?",
+                    (dest_key, len(dest_key) + 1, dest_key + '/'))
+                db.execute(
+                    f"UPDATE {table} SET path = ? || substr(path, ?) WHERE path = ? OR substr(path, 1, ?) = ?",
+                    (dest_key, len(src_key) + 1, src_key, len(src_key) + 1, src_key + '/'))
+            db.commit()
+
+        # a moved file keeps its inode, anything else means it changed on the way
+        entry = self.get(dest_path)
+        if entry is not None:
+            self.update(dest_path)
+
+    def base_hash(self, path: Path | str) -> Optional[str]:
+        """Hash of the last synchronized version, see bases.BaseStore"""
+        with self.lock:
+            row = self.connect().execute('SELECT hash FROM bases WHERE path = ?', (self.key(path),)).fetchone()
+        return row[0] if row is not None else None
+
+    def set_base_hash(self, path: Path | str, content_hash: str):
+        with self.lock:
+            db = self.connect()
+            db.execute('INSERT OR REPLACE INTO bases (path, hash) VALUES (?, ?)', (self.key(path), content_hash))
+            db.commit()
+
+    def reconcile(self):
+        """Bring the index up to date with a stat-only scan, changed files are rehashed lazily"""
+        with self.lock:
+            db = self.connect()
+            indexed = {row[0]: IndexEntry(*row) for row in db.execute(
+                'SELECT path, size, mtime_ns, inode, hash FROM files')}
+
+            changed = []
+            for path in self.ignore.walk(self.root):
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+
+                key = self.key(path.relative_to(self.root))
+                entry = indexed.pop(key, None)
+                if entry is None or not entry.matches(stat):
+                    changed.append((key, stat.st_size, stat.st_mtime_ns, stat.st_ino, None))
+
+            db.executemany(
+                'INSERT OR REPLACE INTO files (path, size, mtime_ns, inode, hash) VALUES (?, ?, ?, ?, ?)',
+                changed)
+            db.executemany('DELETE FROM files WHERE path = ?', [(key,) for key in indexed])
+            db.commit()
+
+        logging.info('Index reconciled, %s changed and %s removed files', len(changed), len(indexed))
+
+    @staticmethod
+    def key(path: Path | str) -> str:
+        return Path(os.path.normpath(path)).as_posix()
+
+
+file_index = FileIndex(cwd, cwd / SYNC_DIR / INDEX_FILE, ignore_rules)
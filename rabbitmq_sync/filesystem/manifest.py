@@ -0,0 +1,124 @@
+import dataclasses
+import os
+from pathlib import Path
+from typing import Optional
+
+from rabbitmq_sync.utils.hashing import bytes_hash, file_hash
+from .ignore import IgnoreRules
+from .index import FileIndex
+
+
+@dataclasses.dataclass
+class ManifestNode:
+    hash: str
+    is_directory: bool
+    size: int = 0
+    mtime_ns: int = 0
+    children: dict[str, 'ManifestNode'] = dataclasses.field(default_factory=dict)
+
+
+class Manifest:
+    """
+    Merkle tree of a directory.
+    File hashes cover size and content, directory hashes cover names and hashes of children,
+    so two equal directory hashes mean equal subtrees.
+    """
+
+    def __init__(self, root: Path, index: FileIndex = None, ignore: IgnoreRules = None):
+        self.root = root
+        self.index = index
+        self.ignore = ignore
+        self.tree: Optional[ManifestNode] = None
+
+    def refresh(self, path: str = ''):
+        """Rescans the directory at path, the hashes of the directories above it are updated"""
+        parts = split_path(path)
+        if self.tree is None or not parts:
+            self.tree = self.scan_dir(self.root, self.tree)
+            return
+
+        parents = [self.tree]
+        for part in parts[:-1]:
+            node = parents[-1].children.get(part)
+            if node is None or not node.is_directory:
+                # not known yet, scan everything
+                self.tree = self.scan_dir(self.root, self.tree)
+                return
+            parents.append(node)
+
+        dir_path = self.root.joinpath(*parts)
+        children = parents[-1].children
+        if dir_path.is_dir() and not dir_path.is_symlink() \
+                and (self.ignore is None or not self.ignore.is_entry_ignored('/'.join(parts), True)):
+            children[parts[-1]] = self.scan_dir(dir_path, children.get(parts[-1]))
+        else:
+            children.pop(parts[-1], None)
+
+        for node in reversed(parents):
+            node.hash = dir_hash(node.children)
+
+    def node_at(self, path: str) -> Optional[ManifestNode]:
+        if self.tree is None:
+            self.refresh()
+
+        node = self.tree
+        for part in split_path(path):
+            if node is None or not node.is_directory:
+                return None
+            node = node.children.get(part)
+        return node
+
+    def scan_dir(self, path: Path, previous: Optional[ManifestNode]) -> ManifestNode:
+        children = dict()
+        previous_children = previous.children if previous is not None else dict()
+
+        with os.scandir(path) as it:
+            for entry in it:
+                entry_path = path / entry.name
+                previous_child = previous_children.get(entry.name)
+
+                is_dir = entry.is_dir(follow_symlinks=False)
+
+                if self.ignore is not None \
+                        and self.ignore.is_entry_ignored(entry_path.relative_to(self.root).as_posix(), is_dir):
+                    continue
+                elif is_dir:
+                    children[entry.name] = self.scan_dir(entry_path, previous_child)
+                elif entry.is_file(follow_symlinks=False):
+                    children[entry.name] = self.scan_file(entry_path, entry.stat(follow_symlinks=False), previous_child)
+
+        return ManifestNode(
+            hash=dir_hash(children),
+            is_directory=True,
+            children=children)
+
+    def scan_file(self, path: Path, stat: os.stat_result, previous: Optional[ManifestNode]) -> ManifestNode:
+        if previous is not None \
+                and not previous.is_directory \
+                and previous.size == stat.st_size \
+                and previous.mtime_ns == stat.st_mtime_ns:
+            return previous
+
+        if self.index is not None:
+            content_hash = self.index.entry(path.relative_to(self.root), stat).hash
+        else:
+            content_hash = file_hash(path)
+
+        return ManifestNode(
+            hash=bytes_hash(f'{stat.st_size}:{content_hash}'.encode()),
+            is_directory=False,
+            size=stat.st_size,
+            mtime_ns=stat.st_mtime_ns)
+
+
+def dir_hash(children: dict[str, ManifestNode]) -> str:
+    lines = (f'{name}\0{"d" if node.is_directory else "f"}\0{node.hash}' for name, node in sorted(children.items()))
+    return bytes_hash('\n'.join(lines).encode())
+
+
+def split_path(path: str) -> list[str]:
+    return [part for part in path.split('/') if part and part != '.']
+
+
+def join_path(parent: str, name: str) -> str:
+    return f'{parent}/{name}' if parent else name
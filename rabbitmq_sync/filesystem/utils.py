@@ -1,5 +1,11 @@
 import os.path
+import shutil
 from pathlib import Path
+from typing import Iterable
+from uuid import uuid4
+
+from rabbitmq_sync.utils.hashing import new_hash
+from .config import PART_POSTFIX
 
 cwd = Path()
 
@@ -26,6 +32,26 @@ def write_file(path: Path):
         return path.read_text()
 
 
+def write_atomic(path: Path, chunks: Iterable[str | bytes]) -> str:
+    """Writes chunks to a temporary file next to path and puts it in place in one rename, returns the content hash"""
+    tmp_path = path.with_name(f'.{path.name}.{uuid4().hex[:8]}{PART_POSTFIX}')
+    content_hash = new_hash()
+    try:
+        with open(tmp_path, 'wb') as f:
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode()
+                content_hash.update(chunk)
+                f.write(chunk)
+        if path.exists():
+            shutil.copymode(path, tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    return content_hash.hexdigest()
+
+
 def path_edited_on(path: Path):
     try:
         return path.lstat().st_mtime
@@ -6,22 +6,97 @@ from kombu import Connection, Producer
 from kombu.pools import producers
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
-from rabbitmq_sync import definitions
+from rabbitmq_sync import definitions, codec
+from .coalesce import EventCoalescer
+from .echo import written_files
+from .ignore import ignore_rules
+from .index import IndexEntry, file_index
 from .events import *
 
 
 class FileChangeHandler(FileSystemEventHandler):
     def __init__(self, connection: Connection):
         self.connection = connection
+        self.coalescer = EventCoalescer(self.publish)
 
     def on_any_event(self, event):
         dict_event: FileSystemEvent = self.get_dict(event)
+
+        if any(ignore_rules.is_ignore_file(path) for path in self.event_paths(dict_event)):
+            ignore_rules.reload()
+
+        dict_event = self.without_ignored(dict_event)
+        if dict_event is not None:
+            self.coalescer.add(dict_event)
+
+    @staticmethod
+    def event_paths(event: FileSystemEvent) -> list[str]:
+        return [event['src_path'], event['dest_path']] if 'dest_path' in event else [event['src_path']]
+
+    @staticmethod
+    def without_ignored(event: FileSystemEvent) -> Optional[FileSystemEvent]:
+        """Event with ignored paths taken out, None if nothing is left"""
+        src_ignored = ignore_rules.is_ignored(event['src_path'], event['is_directory'])
+        if 'dest_path' not in event:
+            return None if src_ignored else event
+
+        dest_ignored = ignore_rules.is_ignored(event['dest_path'], event['is_directory'])
+        if src_ignored and dest_ignored:
+            return None
+        if src_ignored:
+            # moved in from an ignored path, for everybody else it was just created
+            created = {key: value for key, value in event.items() if key != 'dest_path'}
+            created.update(event_type=EVENT_TYPE_CREATED, src_path=event['dest_path'])
+            return created
+        if dest_ignored:
+            deleted = {key: value for key, value in event.items() if key != 'dest_path'}
+            deleted.update(event_type=EVENT_TYPE_DELETED)
+            return deleted
+        return event
+
+    def publish(self, events: list[FileSystemEvent]):
+        events = [event for event in events if self.update_index(event) and not written_files.is_echo(event)]
+
+        if not events:
+            return
+        elif len(events) == 1:
+            content = events[0]
+        else:
+            content: FileSystemEventBatch = {
+                'event_type': EVENT_TYPE_BATCH,
+                'events': events,
+            }
+
         with producers[self.connection].acquire(block=False) as producer:
             producer: Producer
-            producer.publish(dict_event,
+            producer.publish(content,
                              exchange=definitions.main_exchange,
                              routing_key='event.file',
-                             headers={'client_id': definitions.client_id})
+                             headers={'client_id': definitions.client_id},
+                             serializer=codec.negotiated())
+
+    @staticmethod
+    def update_index(event: FileSystemEvent) -> bool:
+        """Update the index and add hash and size of files to the event, False if it changed nothing"""
+        if event['event_type'] == EVENT_TYPE_DELETED:
+            file_index.remove(event['src_path'])
+        elif event['event_type'] == EVENT_TYPE_MOVED:
+            file_index.move(event['src_path'], event['dest_path'])
+            if not event['is_directory']:
+                # lets the other side rename its own copy instead of transferring it
+                add_hash(event, file_index.entry(event['dest_path']))
+        elif event['event_type'] in (EVENT_TYPE_CREATED, EVENT_TYPE_MODIFIED) and not event['is_directory']:
+            previous = file_index.get(event['src_path'])
+            file_index.update(event['src_path'])
+            entry = file_index.entry(event['src_path'])
+            add_hash(event, entry)
+
+            if event['event_type'] == EVENT_TYPE_MODIFIED \
+                    and previous is not None and entry is not None \
+                    and previous.hash is not None and previous.hash == entry.hash:
+                # touched or saved without changes
+                return False
+        return True
 
     def get_dict(self, event) -> FileSystemEvent:
         now = time.time()
@@ -34,12 +109,19 @@ class FileChangeHandler(FileSystemEventHandler):
             'src_path': str(os.path.relpath(event.src_path))
         }
 
-        if hasattr(event, 'dest_path'):
+        # newer watchdog versions set an empty dest_path on every event
+        if getattr(event, 'dest_path', ''):
             dict_event['dest_path'] = str(os.path.relpath(event.dest_path))
 
         return dict_event
 
 
+def add_hash(event: FileSystemEvent, entry: Optional[IndexEntry]):
+    if entry is not None:
+        event['hash'] = entry.hash
+        event['size'] = entry.size
+
+
 def start_observing_filesystem(path: Path, connection: Connection):
     abspath = os.path.abspath(path)
     logging.info('Observing filesystem at %s', abspath)
@@ -0,0 +1,225 @@
+"""
+Cache of responses to GET and HEAD requests, shared by everybody using the proxy.
+
+Follows the rules of a shared cache: responses marked no-store or private are not kept, an entry is fresh for its
+s-maxage, max-age or until Expires but never longer than the configured ttl, entries that are no longer fresh are
+revalidated with If-None-Match/If-Modified-Since when they came with an ETag or Last-Modified.
+Only bodies that came whole in the response message are cached, streamed ones are passed on as they are.
+"""
+import dataclasses
+import time
+from collections import Counter, OrderedDict
+from email.utils import parsedate_to_datetime
+from threading import Lock
+from typing import Optional
+
+from requests.structures import CaseInsensitiveDict
+
+from .config import CACHE_MAX_SIZE, CACHE_MAX_BYTES, CACHE_TTL_SECONDS
+
+CACHEABLE_METHODS = {'GET', 'HEAD'}
+CACHEABLE_STATUS_CODES = {200, 203, 204, 300, 301, 308, 404, 410}
+# request headers asking the destination whether a stored response is still valid
+CONDITIONAL_HEADERS = {'If-None-Match': 'ETag', 'If-Modified-Since': 'Last-Modified'}
+
+
+@dataclasses.dataclass
+class CachedResponse:
+    status_code: int
+    headers: dict
+    body: bytes
+    stored_on: float
+    # monotonic time the entry has to be revalidated after
+    expires_on: float
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + sum(len(name) + len(value) for name, value in self.headers.items())
+
+    def age(self, now: float) -> int:
+        return int(now - self.stored_on)
+
+    def validators(self) -> dict:
+        return validators(CaseInsensitiveDict(self.headers))
+
+
+def validators(headers: CaseInsensitiveDict) -> dict:
+    """Conditional request headers for a response with an ETag or Last-Modified"""
+    return {name: headers[source] for name, source in CONDITIONAL_HEADERS.items() if source in headers}
+
+
+def cache_control(headers: CaseInsensitiveDict) -> dict[str, Optional[str]]:
+    """Cache-Control directives, lower case, with their value or None"""
+    directives = dict()
+    for directive in headers.get('Cache-Control', '').split(','):
+        name, _, value = directive.strip().partition('=')
+        if name:
+            directives[name.lower()] = value.strip('"') if value else None
+    return directives
+
+
+def seconds(value: Optional[str]) -> Optional[float]:
+    try:
+        return max(0., float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+class ResponseCache:
+    """
+    Responses by method and url, least recently used first.
+    Evicted when there are more than max_size of them or they take more than max_bytes.
+    """
+
+    def __init__(self, max_size: int = CACHE_MAX_SIZE, max_bytes: int = CACHE_MAX_BYTES,
+                 ttl: float = CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries: OrderedDict[str, CachedResponse] = OrderedDict()
+        self.size = 0
+        # hits, misses, revalidated, stored, evicted
+        self.counters = Counter()
+        self.lock = Lock()
+
+    def lookup(self, method: str, url: str, headers: dict) -> tuple[Optional[CachedResponse], bool]:
+        """The entry for a request and whether it is fresh enough to answer it without asking the destination"""
+        if method not in CACHEABLE_METHODS:
+            # a request that may change the resource makes what is stored for it outdated
+            self.invalidate(url)
+            return None, False
+
+        headers = CaseInsensitiveDict(headers)
+        directives = cache_control(headers)
+        if not self.cacheable_request(headers, directives):
+            return None, False
+
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(f'{method} {url}')
+            if entry is not None:
+                self.entries.move_to_end(f'{method} {url}')
+
+            fresh = entry is not None and entry.expires_on > now and 'no-cache' not in directives
+            if fresh and 'max-age' in directives:
+                fresh = entry.age(now) < (seconds(directives['max-age']) or 0)
+            self.counters['hits' if fresh else 'misses'] += 1
+        return entry, fresh
+
+    @staticmethod
+    def cacheable_request(headers: CaseInsensitiveDict, directives: dict) -> bool:
+        # responses to requests with credentials are meant for their caller only,
+        # the caller's own conditional request needs the destination's answer to it
+        return ('no-store' not in directives
+                and 'Authorization' not in headers
+                and not any(name in headers for name in CONDITIONAL_HEADERS))
+
+    @staticmethod
+    def conditional(entry: Optional[CachedResponse], headers: dict) -> dict:
+        """Request headers asking whether entry is still valid, when it can be revalidated"""
+        if entry is None:
+            return headers
+        return {**headers, **entry.validators()}
+
+    def update(self, method: str, url: str, request_headers: dict, entry: Optional[CachedResponse],
+               status_code: int, headers: dict, body: bytes) -> Optional[CachedResponse]:
+        """
+        Stores the destination's answer to a request when it may be reused.
+        Returns the entry to answer with instead when the answer says the entry revalidated is still valid.
+        """
+        if method not in CACHEABLE_METHODS:
+            return None
+
+        request_headers = CaseInsensitiveDict(request_headers)
+        if not self.cacheable_request(request_headers, cache_control(request_headers)):
+            return None
+
+        if status_code == 304 and entry is not None:
+            # the stored response with the headers it got now
+            merged = CaseInsensitiveDict(entry.headers)
+            merged.update(headers)
+            headers = dict(merged)
+            status_code, body = entry.status_code, entry.body
+            updated = self.store(method, url, status_code, headers, body)
+            with self.lock:
+                self.counters['revalidated'] += 1
+            return updated or dataclasses.replace(entry, headers=headers)
+
+        self.store(method, url, status_code, headers, body)
+        return None
+
+    def store(self, method: str, url: str, status_code: int, headers: dict,
+              body: bytes) -> Optional[CachedResponse]:
+        key = f'{method} {url}'
+        ttl = self.freshness(status_code, CaseInsensitiveDict(headers))
+        now = time.monotonic()
+        entry = CachedResponse(status_code, headers, body, now, now + ttl) if ttl is not None else None
+
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.size -= previous.size
+            if entry is None or entry.size > self.max_bytes:
+                return None
+
+            self.entries[key] = entry
+            self.size += entry.size
+            self.counters['stored'] += 1
+            while len(self.entries) > self.max_size or self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= evicted.size
+                self.counters['evicted'] += 1
+        return entry
+
+    def freshness(self, status_code: int, headers: CaseInsensitiveDict) -> Optional[float]:
+        """Seconds a response stays fresh, 0 when it has to be revalidated every time, None when it is not kept"""
+        directives = cache_control(headers)
+        if (status_code not in CACHEABLE_STATUS_CODES
+                or 'no-store' in directives
+                or 'private' in directives
+                # responses setting cookies belong to one caller only
+                or 'Set-Cookie' in headers
+                # variants by request headers are not told apart, bodies are decoded whatever the encoding
+                or any(name.strip().lower() != 'accept-encoding' for name in headers.get('Vary', '').split(',')
+                       if name.strip())):
+            return None
+
+        if 'no-cache' in directives:
+            ttl = 0.
+        elif seconds(directives.get('s-maxage')) is not None:
+            ttl = seconds(directives['s-maxage'])
+        elif seconds(directives.get('max-age')) is not None:
+            ttl = seconds(directives['max-age'])
+        else:
+            ttl = self.expires_in(headers)
+        ttl = max(0., min(ttl, self.ttl) - (seconds(headers.get('Age')) or 0))
+
+        if ttl == 0 and not validators(headers):
+            return None
+        return ttl
+
+    @staticmethod
+    def expires_in(headers: CaseInsensitiveDict) -> float:
+        try:
+            expires = parsedate_to_datetime(headers['Expires'])
+            date = parsedate_to_datetime(headers['Date']) if 'Date' in headers else None
+        except (KeyError, TypeError, ValueError):
+            return 0.
+        if date is None or expires.tzinfo is None or date.tzinfo is None:
+            return max(0., expires.timestamp() - time.time())
+        return max(0., (expires - date).total_seconds())
+
+    def invalidate(self, url: str):
+        with self.lock:
+            for method in CACHEABLE_METHODS:
+                entry = self.entries.pop(f'{method} {url}', None)
+                if entry is not None:
+                    self.size -= entry.size
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                **{name: self.counters[name] for name in ('hits', 'misses', 'revalidated', 'stored', 'evicted')},
+                'entries': len(self.entries),
+                'bytes': self.size,
+            }
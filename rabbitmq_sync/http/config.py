@@ -6,16 +6,71 @@ config.read('rabbit_sync_http_endpoints.ini')
 
 # example
 #
-# [main]
+# [http]
+# server = waitress
+# host = 127.0.0.1
+# port = 8080
+# server_threads = 32
 # only_with_prefix = false
+# timeout = 5
+# pending_ttl = 10
+# pending_size = 1024
+# upstream_pool_size = 10
+# upstream_connect_timeout = 3
+# upstream_read_timeout = 5
+# upstream_workers = 8
+# upstream_queue_size = 64
+# body_chunk_size = 262144
+# publish_timeout = 5
+# publishers = 6
+# cache = false
+# upstream_cache = false
+# cache_size = 1024
+# cache_bytes = 67108864
+# cache_ttl = 300
+# cache_stats_path = /_rabbit/cache
 #
 # [consul]
 # prefix = /consul
 # destination = consul:8500
 
 PREFIX_TO_DESTINATION = dict()
+# waitress (a thread per request in flight) or asyncio (no thread per request in flight)
+SERVER = config.get('http', 'server', fallback='waitress')
+HOST = config.get('http', 'host', fallback='127.0.0.1')
+PORT = config.getint('http', 'port', fallback=8080)
+# waitress only, requests in flight at the same time, they take turns publishing, see PUBLISHERS
+SERVER_THREADS = config.getint('http', 'server_threads', fallback=32)
 ONLY_WITH_PREFIX = config.getboolean('http', 'only_with_prefix',  fallback=False)
 HTTP_TIMEOUT_SECONDS = config.getfloat('http', 'timeout',  fallback=5.)
+# requests waiting for a response are forgotten after this long or when there are more of them than pending_size
+PENDING_TTL_SECONDS = config.getfloat('http', 'pending_ttl', fallback=HTTP_TIMEOUT_SECONDS * 2)
+PENDING_MAX_SIZE = config.getint('http', 'pending_size', fallback=1024)
+# kept alive connections per destination
+UPSTREAM_POOL_SIZE = config.getint('http', 'upstream_pool_size', fallback=10)
+UPSTREAM_CONNECT_TIMEOUT_SECONDS = config.getfloat('http', 'upstream_connect_timeout', fallback=3.)
+UPSTREAM_READ_TIMEOUT_SECONDS = config.getfloat('http', 'upstream_read_timeout', fallback=HTTP_TIMEOUT_SECONDS)
+# threads performing proxied requests, each publishes its response, keep it below the kombu producer pool limit
+UPSTREAM_WORKERS = config.getint('http', 'upstream_workers', fallback=8)
+# requests waiting for a free thread, more are answered with 503 right away
+UPSTREAM_QUEUE_SIZE = config.getint('http', 'upstream_queue_size', fallback=64)
+# request and response bodies are sent in messages of at most this many bytes
+BODY_CHUNK_SIZE = config.getint('http', 'body_chunk_size', fallback=256 * 1024)
+# longest wait for a free producer of the shared kombu pool, requests are answered with 503 after it
+PUBLISH_TIMEOUT_SECONDS = config.getfloat('http', 'publish_timeout', fallback=HTTP_TIMEOUT_SECONDS)
+# http publishes at the same time, front end threads and upstream workers together,
+# keep it below the kombu producer pool limit (10) so filesystem and copy events still get producers
+PUBLISHERS = config.getint('http', 'publishers', fallback=6)
+# responses to GET and HEAD reused by the requesting client, and by the client reaching the destination
+CACHE = config.getboolean('http', 'cache', fallback=False)
+UPSTREAM_CACHE = config.getboolean('http', 'upstream_cache', fallback=False)
+# cached responses are evicted least recently used first when there are more of them or they take more bytes
+CACHE_MAX_SIZE = config.getint('http', 'cache_size', fallback=1024)
+CACHE_MAX_BYTES = config.getint('http', 'cache_bytes', fallback=64 * 1024 * 1024)
+# longest a cached response is used without revalidating it, whatever the destination allows
+CACHE_TTL_SECONDS = config.getfloat('http', 'cache_ttl', fallback=300.)
+# answered locally with the cache counters as json instead of being proxied
+CACHE_STATS_PATH = config.get('http', 'cache_stats_path', fallback='/_rabbit/cache')
 
 for section in config.sections():
     if section == 'http':
@@ -1,16 +1,39 @@
+from typing_extensions import NotRequired
+
 from rabbitmq_sync.events import BaseEvent
 
 EVENT_TYPE_HTTP_REQUEST = 'http_request'
 EVENT_TYPE_HTTP_RESPONSE = 'http_response'
+EVENT_TYPE_HTTP_BODY = 'http_body'
 
 
 class HttpRequest(BaseEvent):
     method: str
     correlation_id: str
+    # as requested from the proxy, with the prefix as first path segment
     url: str
+    # work queue the request was routed to, see routing
+    prefix: str
     headers: dict
-    body: str
+    # the whole body or its first chunk
+    body: bytes
+    # request only: the rest of the body follows as HttpBody events in routing.body_queue
+    body_streamed: NotRequired[bool]
+    # request only: size of the whole body when the client sent it
+    body_size: NotRequired[int]
 
 
 class HttpResponse(HttpRequest):
-    status_code: int
\ No newline at end of file
+    status_code: int
+    # the rest of the body follows as HttpBody events to the requester
+    streamed: NotRequired[bool]
+
+
+class HttpBody(BaseEvent):
+    correlation_id: str
+    # 1 for the chunk after the one in the request or response
+    seq: int
+    content: bytes
+    last: bool
+    # the sender failed to read the rest of the body
+    aborted: NotRequired[bool]
\ No newline at end of file
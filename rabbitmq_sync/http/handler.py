@@ -1,20 +1,95 @@
-import base64
+import asyncio
+import json
 import logging
+import queue
 import sys
+import time
 from urllib.parse import urlparse
 import uuid
-import time
 import requests
-from threading import Thread, Lock
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread, BoundedSemaphore
+from typing import Optional, Iterable, Iterator, AsyncIterator, TypeVar
 
-import waitress
 from flask import Flask, request, Response
-from kombu import Connection, Producer
+from kombu import Connection, Exchange, Producer
+from kombu.exceptions import LimitExceeded
 from kombu.pools import producers
-from rabbitmq_sync import definitions
-from rabbitmq_sync.events import EVENT_INTERNAL_READY
-from .config import ONLY_WITH_PREFIX, PREFIX_TO_DESTINATION, HTTP_TIMEOUT_SECONDS
+from rabbitmq_sync import definitions, compression, codec
+from rabbitmq_sync.codec import as_bytes, ACCEPT_CONTENT
+from rabbitmq_sync.events import (
+    BaseEvent,
+    PingPong,
+    Requeue,
+    EVENT_TYPE_PING,
+    EVENT_TYPE_PONG,
+    EVENT_INTERNAL_READY,
+    EVENT_INTERNAL_ADVERTISE,
+    EVENT_INTERNAL_QUEUES,
+    EVENT_INTERNAL_PREFETCH,
+    EVENT_INTERNAL_PEER_GONE,
+)
+from .cache import ResponseCache, CachedResponse
+from .config import (
+    PREFIX_TO_DESTINATION,
+    HTTP_TIMEOUT_SECONDS,
+    SERVER,
+    HOST,
+    PORT,
+    BODY_CHUNK_SIZE,
+    PUBLISH_TIMEOUT_SECONDS,
+    PUBLISHERS,
+    CACHE,
+    UPSTREAM_CACHE,
+    CACHE_STATS_PATH,
+    UPSTREAM_WORKERS,
+)
 from .events import *
+from .pending import PendingRequest, PendingRequests, InOrder, aborted_chunk
+from .routing import Executors, http_exchange, served_prefixes, work_queue, body_queue, url_prefix, ANY_PREFIX
+from .server import AsyncioServer, serve_waitress, Body
+from .upstream import Upstream, StreamedBody, iter_body
+
+# methods passed to the destination as they are, anything else is sent as GET
+METHODS = ['GET', 'HEAD', 'POST', 'DELETE', 'PUT', 'PATCH']
+# headers of a single connection, never passed on, Content-Length is set for the body again
+HOP_BY_HOP_HEADERS = {
+    'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization', 'te', 'trailers', 'transfer-encoding',
+    'upgrade', 'content-length',
+}
+# requests decodes response bodies
+RESPONSE_DROPPED_HEADERS = HOP_BY_HOP_HEADERS | {'content-encoding'}
+# hit or revalidated when answered from the cache of the requesting client or of the client reaching the destination
+CACHE_HEADER = 'rabbit_cache'
+UPSTREAM_CACHE_HEADER = 'rabbit_upstream_cache'
+
+T = TypeVar('T')
+
+
+def with_last(items: Iterable[T]) -> Iterator[tuple[T, bool]]:
+    """Items paired with whether they are the last one"""
+    items = iter(items)
+    try:
+        current = next(items)
+    except StopIteration:
+        return
+
+    for following in items:
+        yield current, False
+        current = following
+    yield current, True
+
+
+async def async_with_last(items: AsyncIterator[T]) -> AsyncIterator[tuple[T, bool]]:
+    try:
+        current = await anext(items)
+    except StopAsyncIteration:
+        return
+
+    async for following in items:
+        yield current, False
+        current = following
+    yield current, True
 
 
 def register(connection: Connection):
@@ -22,8 +97,17 @@ def register(connection: Connection):
 
     return {
         EVENT_INTERNAL_READY: handler.on_ready,
+        EVENT_INTERNAL_ADVERTISE: lambda: {'http_prefixes': served_prefixes()},
+        EVENT_INTERNAL_QUEUES: lambda: [work_queue(prefix) for prefix in served_prefixes()],
+        # requests are acknowledged once they are handed to the upstream pool,
+        # a client takes a few more of them while its workers are busy and others get the rest
+        EVENT_INTERNAL_PREFETCH: lambda: UPSTREAM_WORKERS,
+        EVENT_INTERNAL_PEER_GONE: handler.on_peer_gone,
+        EVENT_TYPE_PING: handler.on_peer,
+        EVENT_TYPE_PONG: handler.on_peer,
         EVENT_TYPE_HTTP_REQUEST: handler.on_rabbit_request,
-        EVENT_TYPE_HTTP_RESPONSE: handler.on_rabbit_response
+        EVENT_TYPE_HTTP_RESPONSE: handler.on_rabbit_response,
+        EVENT_TYPE_HTTP_BODY: handler.on_rabbit_body,
     }
 
 
@@ -32,8 +116,14 @@ class Handler:
     def __init__(self, connection: Connection):
         self.connection = connection
         self.flask_app = self.create_app()
-        self.correlation_id_to_response: dict[str, HttpResponse] = dict()
-        self.lock = Lock()
+        self.pending = PendingRequests()
+        self.executors = Executors()
+        self.upstream = Upstream()
+        self.cache = ResponseCache() if CACHE else None
+        self.upstream_cache = ResponseCache() if UPSTREAM_CACHE else None
+        self.publish_slots = BoundedSemaphore(PUBLISHERS)
+        # kombu publishes block, the asyncio server runs them here instead of on its event loop
+        self.publish_executor = ThreadPoolExecutor(max_workers=PUBLISHERS, thread_name_prefix='http-publish')
 
     def create_app(self):
         app = Flask(__name__)
@@ -46,130 +136,412 @@ class Handler:
 
     def on_ready(self, event):
         if 'no_flask' in sys.argv:
-            return logging.info('Not starting flask')
-
-        logging.info('Starting flask app')
-        t = Thread(
-            target=self.flask_app.run,
-            # args=(self.flask_app,),
-            kwargs={'port': 8080},
-            daemon=True)
+            return logging.info('Not starting http server')
+
+        servers = {
+            'waitress': lambda: serve_waitress(self.flask_app, HOST, PORT),
+            'asyncio': AsyncioServer(self.on_async_request, HOST, PORT).run,
+        }
+        if SERVER not in servers:
+            return logging.error('Unknown http server %s, expected one of %s', SERVER, ', '.join(servers))
+
+        logging.info('Starting %s http server on %s:%s', SERVER, HOST, PORT)
+        t = Thread(target=servers[SERVER], daemon=True)
         t.start()
 
+    def on_peer(self, event: PingPong):
+        self.executors.on_peer(event['client_id'], event.get('http_prefixes'))
+
+    def on_peer_gone(self, event: BaseEvent):
+        self.executors.forget(event['client_id'])
+
     def on_rabbit_request(self, event: HttpRequest):
+        if not self.upstream.submit(self.forward, event):
+            if not event.get('redelivered'):
+                # back to the work queue, another client serving the prefix may have room for it
+                raise Requeue(f'too many upstream requests for {event["url"]}')
+            logging.warning('Too many upstream requests, rejecting %s %s', event['method'], event['url'])
+            self.publish(self.error_response(event, 503), to=event.get('client_id'))
+
+    def forward(self, event: HttpRequest):
+        method = event['method'] if event['method'] in METHODS else 'GET'
+        url = self.get_proxy_url(event['url'], event['prefix'])
+
+        cached, fresh = self.cache_lookup(self.upstream_cache, method, url, event['headers'])
+        if fresh:
+            return self.publish(self.cached_response(event, cached, UPSTREAM_CACHE_HEADER, 'hit'),
+                                to=event.get('client_id'))
+
+        body = bytes(as_bytes(event['body']))
+        if event.get('body_streamed'):
+            body = StreamedBody(self.iter_request_body(event), event.get('body_size'))
 
-        func = {
-            'GET': requests.get,
-            'POST': requests.post,
-            'DELETE': requests.delete,
-            'PUT': requests.put,
-            'PATCH': requests.patch,
-        }.get(event['method'], requests.get)
+        try:
+            headers = ResponseCache.conditional(cached, event['headers'])
+            with self.upstream.request(method, url, headers, body) as result:
+                return self.publish_response(event, result, url, cached)
+        except (requests.exceptions.RequestException, OSError, queue.Empty) as e:
+            logging.warning('Upstream %s %s failed: %r', method, url, e)
+
+        self.publish(self.error_response(event, -1), to=event.get('client_id'))
+
+    def iter_request_body(self, event: HttpRequest) -> Iterator[bytes]:
+        yield bytes(as_bytes(event['body']))
+
+        with self.connection.clone() as connection:
+            with connection.SimpleQueue(body_queue(event['correlation_id']), accept=ACCEPT_CONTENT) as chunks:
+                order = InOrder()
+                while True:
+                    message = chunks.get(timeout=HTTP_TIMEOUT_SECONDS)
+                    message.ack()
+
+                    for chunk in order.add(message.payload):
+                        self.check_chunk(chunk)
+                        yield bytes(as_bytes(chunk['content']))
+                        if chunk['last']:
+                            return
+
+    def publish_response(self, event: HttpRequest, result: requests.Response, url: str,
+                         cached: CachedResponse = None):
+        """
+        The first piece of the body goes with the response, the rest follows as it arrives
+        and an empty last chunk ends it, so no piece waits for the next one to be read.
+        """
+        to = event.get('client_id')
+        blocks = iter_body(result, BODY_CHUNK_SIZE)
+        first = next(blocks, b'')
+        # whatever is left of a finished body is already read, no need to stream it
+        streamed = not result.raw.closed
+        if not streamed:
+            first += b''.join(blocks)
+
+        rabbit_response: HttpResponse = {
+            'event_type': EVENT_TYPE_HTTP_RESPONSE,
+            'correlation_id': event['correlation_id'],
+            'method': event['method'],
+            'url': event['url'],
+            'prefix': event['prefix'],
+            'headers': dict(result.headers),
+            'status_code': result.status_code,
+            'body': first
+        }
+        if streamed:
+            rabbit_response['streamed'] = True
+        else:
+            rabbit_response = self.cache_response(self.upstream_cache, UPSTREAM_CACHE_HEADER, result.request.method,
+                                                  url, event['headers'], cached, rabbit_response)
 
-        body = base64.b64decode(event['body'])
+        self.publish(rabbit_response, to=to)
+        if not streamed:
+            return
 
+        # every piece is read before a producer is taken for it, a slow destination holds none of the shared pool
+        seq = 1
         try:
-            result = func(
-                url=event['url'],
-                headers=event['headers'],
-                data=body)
-
-            rabbit_response: HttpResponse = {
-                'event_type': EVENT_TYPE_HTTP_RESPONSE,
-                'correlation_id': event['correlation_id'],
-                'method': event['method'],
-                'url': event['url'],
-                'headers': dict(result.headers),
-                'status_code': result.status_code,
-                'body': base64.b64encode(result.content).decode('utf-8')
-            }
-
-        except requests.exceptions.ConnectionError or requests.exceptions.ConnectTimeout:
-            rabbit_response: HttpResponse = {
-                'event_type': EVENT_TYPE_HTTP_RESPONSE,
-                'correlation_id': event['correlation_id'],
-                'method': event['method'],
-                'url': event['url'],
-                'headers': dict(),
-                'status_code': -1,
-                'body': ''
-            }
-
-        self.publish(rabbit_response)
+            for content in blocks:
+                self.publish(self.body_chunk(event['correlation_id'], seq, content, False), to=to)
+                seq += 1
+        except requests.exceptions.RequestException as e:
+            logging.warning('Reading response to %s %s failed: %r', event['method'], event['url'], e)
+            self.publish({**aborted_chunk(event['correlation_id']), 'seq': seq}, to=to)
+        else:
+            self.publish(self.body_chunk(event['correlation_id'], seq, b'', True), to=to)
+
+    @staticmethod
+    def body_chunk(correlation_id: str, seq: int, content: bytes, last: bool) -> HttpBody:
+        return {
+            'event_type': EVENT_TYPE_HTTP_BODY,
+            'correlation_id': correlation_id,
+            'seq': seq,
+            'content': content,
+            'last': last,
+        }
+
+    @staticmethod
+    def check_chunk(chunk: HttpBody):
+        if chunk.get('aborted'):
+            raise ConnectionAbortedError(f'Sender of {chunk["correlation_id"]} failed to read the body')
+
+    @staticmethod
+    def error_response(event: HttpRequest, status_code: int) -> HttpResponse:
+        return {
+            'event_type': EVENT_TYPE_HTTP_RESPONSE,
+            'correlation_id': event['correlation_id'],
+            'method': event['method'],
+            'url': event['url'],
+            'prefix': event['prefix'],
+            'headers': dict(),
+            'status_code': status_code,
+            'body': b''
+        }
+
+    @staticmethod
+    def cache_lookup(cache: Optional[ResponseCache], method: str, url: str,
+                     headers: dict) -> tuple[Optional[CachedResponse], bool]:
+        if cache is None:
+            return None, False
+        return cache.lookup(method, url, headers)
+
+    def cache_response(self, cache: Optional[ResponseCache], header: str, method: str, url: str,
+                       request_headers: dict, cached: Optional[CachedResponse],
+                       rabbit_response: HttpResponse) -> HttpResponse:
+        """Stores a whole response for later, answers with cached instead when the response revalidated it"""
+        if cache is None or rabbit_response.get('streamed') or rabbit_response['status_code'] <= 0:
+            return rabbit_response
+
+        revalidated = cache.update(method, url, request_headers, cached, rabbit_response['status_code'],
+                                   rabbit_response['headers'], bytes(as_bytes(rabbit_response['body'])))
+        if revalidated is None:
+            return rabbit_response
+        return self.cached_response(rabbit_response, revalidated, header, 'revalidated')
+
+    def cached_response(self, event: HttpRequest, cached: CachedResponse, header: str, state: str) -> HttpResponse:
+        return {
+            'event_type': EVENT_TYPE_HTTP_RESPONSE,
+            'correlation_id': event['correlation_id'],
+            'method': event['method'],
+            'url': event['url'],
+            'prefix': event['prefix'],
+            'headers': self.cached_headers(cached, header, state),
+            'status_code': cached.status_code,
+            'body': cached.body
+        }
+
+    def cache_hit(self, cached: CachedResponse) -> tuple[int, dict, bytes]:
+        """Answered by the requesting client itself"""
+        headers = self.end_to_end_headers(self.cached_headers(cached, CACHE_HEADER, 'hit'), RESPONSE_DROPPED_HEADERS)
+        return cached.status_code, headers, cached.body
+
+    @staticmethod
+    def cached_headers(cached: CachedResponse, header: str, state: str) -> dict:
+        return {**cached.headers, 'Age': str(cached.age(time.monotonic())), header: state}
+
+    def stats_response(self) -> tuple[int, dict, bytes]:
+        stats = {
+            'cache': self.cache.stats() if self.cache is not None else None,
+            'upstream_cache': self.upstream_cache.stats() if self.upstream_cache is not None else None,
+        }
+        return 200, {'Content-Type': 'application/json'}, json.dumps(stats).encode()
 
     def on_rabbit_response(self, event: HttpResponse):
-        with self.lock:
-            self.correlation_id_to_response[event['correlation_id']] = event
+        self.pending.complete(event)
+
+    def on_rabbit_body(self, event: HttpBody):
+        self.pending.feed(event)
 
     def on_flask_request(self):
-        rabbit_request = self.get_rabbit_request()
-        self.publish(rabbit_request)
+        if request.path == CACHE_STATS_PATH:
+            status_code, headers, body = self.stats_response()
+            return Response(body, status=status_code, headers=headers)
+
+        request_headers = dict(request.headers)
+        cached, fresh = self.cache_lookup(self.cache, request.method, request.url, request_headers)
+        if fresh:
+            status_code, headers, body = self.cache_hit(cached)
+            return Response(body, status=status_code, headers=headers)
+
+        body = with_last(iter(lambda: request.stream.read(BODY_CHUNK_SIZE), b''))
+        first, last = next(body, (b'', True))
+
+        rabbit_request = self.get_rabbit_request(
+            request.method, request.url, ResponseCache.conditional(cached, request_headers), first, streamed=not last)
+        if rabbit_request is None:
+            return Response(status=502, headers={'rabbit_no_executor': url_prefix(request.url)})
+
+        correlation_id = rabbit_request['correlation_id']
+        chunks = queue.Queue()
+        pending = self.pending.add(correlation_id, on_chunk=chunks.put)
+        try:
+            self.publish_request(rabbit_request)
+            for seq, (content, last) in enumerate(body, 1):
+                self.publish_request_chunk(self.body_chunk(correlation_id, seq, content, last))
+        except LimitExceeded:
+            self.pending.discard(pending)
+            return Response(status=503, headers={'rabbit_busy': PUBLISH_TIMEOUT_SECONDS})
+
+        rabbit_response = self.pending.wait(pending, HTTP_TIMEOUT_SECONDS)
+        if rabbit_response is None:
+            # timeout
+            return Response(status=500, headers={'rabbit_timeout': HTTP_TIMEOUT_SECONDS})
+
+        rabbit_response = self.cache_response(self.cache, CACHE_HEADER, request.method, request.url, request_headers,
+                                              cached, rabbit_response)
+        status_code, headers, first = self.response_parts(rabbit_response)
+        if not rabbit_response.get('streamed'):
+            return Response(first, status=status_code, headers=headers)
+        return Response(self.iter_response_body(pending, first, chunks), status=status_code, headers=headers)
+
+    def iter_response_body(self, pending: PendingRequest, first: bytes, chunks: queue.Queue) -> Iterator[bytes]:
+        order = InOrder()
+        try:
+            yield first
+            while True:
+                for chunk in order.add(chunks.get(timeout=HTTP_TIMEOUT_SECONDS)):
+                    self.check_chunk(chunk)
+                    yield bytes(as_bytes(chunk['content']))
+                    if chunk['last']:
+                        return
+        finally:
+            self.pending.discard(pending)
+
+    async def on_async_request(self, method: str, url: str, headers: dict,
+                               body: AsyncIterator[bytes]) -> tuple[int, dict, Body]:
+        if urlparse(url).path == CACHE_STATS_PATH:
+            return self.stats_response()
+
+        cached, fresh = self.cache_lookup(self.cache, method, url, headers)
+        if fresh:
+            return self.cache_hit(cached)
+
+        body = async_with_last(body)
+        try:
+            first, last = await anext(body)
+        except StopAsyncIteration:
+            first, last = b'', True
+
+        rabbit_request = self.get_rabbit_request(
+            method, url, ResponseCache.conditional(cached, headers), first, streamed=not last)
+        if rabbit_request is None:
+            return 502, {'rabbit_no_executor': url_prefix(url)}, b''
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        chunks = asyncio.Queue()
+
+        def on_done(pending: PendingRequest):
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(pending.response))
 
-        return self.wait_response(rabbit_request['correlation_id'])
+        def on_chunk(chunk: HttpBody):
+            loop.call_soon_threadsafe(chunks.put_nowait, chunk)
+
+        correlation_id = rabbit_request['correlation_id']
+        pending = self.pending.add(correlation_id, on_done, on_chunk)
+        rabbit_response = None
+        busy = False
+        try:
+            await loop.run_in_executor(self.publish_executor, self.publish_request, rabbit_request)
+            seq = 1
+            async for content, last in body:
+                chunk = self.body_chunk(correlation_id, seq, content, last)
+                await loop.run_in_executor(self.publish_executor, self.publish_request_chunk, chunk)
+                seq += 1
+            rabbit_response = await asyncio.wait_for(future, HTTP_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        except LimitExceeded:
+            busy = True
+        finally:
+            if rabbit_response is None or not rabbit_response.get('streamed'):
+                self.pending.discard(pending)
+
+        if busy:
+            return 503, {'rabbit_busy': PUBLISH_TIMEOUT_SECONDS}, b''
+        if rabbit_response is None:
+            return 500, {'rabbit_timeout': HTTP_TIMEOUT_SECONDS}, b''
+
+        rabbit_response = self.cache_response(self.cache, CACHE_HEADER, method, url, headers, cached, rabbit_response)
+        status_code, headers, first = self.response_parts(rabbit_response)
+        if not rabbit_response.get('streamed'):
+            return status_code, headers, first
+        return status_code, headers, self.async_iter_response_body(pending, first, chunks)
+
+    async def async_iter_response_body(self, pending: PendingRequest, first: bytes,
+                                       chunks: asyncio.Queue) -> AsyncIterator[bytes]:
+        order = InOrder()
+        try:
+            yield first
+            while True:
+                for chunk in order.add(await asyncio.wait_for(chunks.get(), HTTP_TIMEOUT_SECONDS)):
+                    self.check_chunk(chunk)
+                    yield bytes(as_bytes(chunk['content']))
+                    if chunk['last']:
+                        return
+        finally:
+            self.pending.discard(pending)
+
+    def get_rabbit_request(self, method: str, url: str, headers: dict, body: bytes,
+                           streamed: bool = False) -> Optional[HttpRequest]:
+        """None when no known client can reach the destination, body is the first chunk when streamed"""
+        prefix = self.executors.route(url)
+        if prefix is None:
+            return None
 
-    def get_rabbit_request(self):
         correlation_id = str(uuid.uuid4())
-        url = self.get_proxy_url(request.url)
-        body = base64.b64encode(request.data).decode('utf-8')
 
         rabbit_request: HttpRequest = {
             'event_type': EVENT_TYPE_HTTP_REQUEST,
             'correlation_id': correlation_id,
 
-            'method': request.method,
+            'method': method,
+            # the executor maps the prefix to its own destination
             'url': url,
-            'headers': dict(request.headers),
+            'prefix': prefix,
+            'headers': self.end_to_end_headers(headers),
             'body': body
         }
+        if streamed:
+            rabbit_request['body_streamed'] = True
+            if 'Content-Length' in headers:
+                rabbit_request['body_size'] = int(headers['Content-Length'])
 
         return rabbit_request
 
-    def get_proxy_url(self, url: str):
+    def get_proxy_url(self, url: str, prefix: str):
         parsed = urlparse(url)
 
         location = parsed.path
-        slash, prefix, other = location.split('/', 2)
-        prefix: str
-
-        if prefix in PREFIX_TO_DESTINATION:
-            parsed = parsed\
-                ._replace(netloc=PREFIX_TO_DESTINATION[prefix])\
-                ._replace(path=other)
-            return parsed.geturl()
-        elif ONLY_WITH_PREFIX:
-            raise Exception('Urls only with prefix are allowed')
-        else:
-            parsed = parsed\
-                ._replace(netloc=prefix.removeprefix('/'))\
-                ._replace(path=other)
-            return parsed.geturl()
-
-    def get_response(self, rabbit_response: HttpResponse):
-        response = Response()
-        response.headers = rabbit_response['headers']
-        response.data = base64.b64decode(rabbit_response['body'])
-        response.status_code = rabbit_response['status_code']
-        return response
-
-    def wait_response(self, correlation_id: str):
-        start_time = time.time()
-        while time.time() - start_time < HTTP_TIMEOUT_SECONDS:
-
-            with self.lock:
-                maybe_rabbit_response = self.correlation_id_to_response.get(correlation_id)
-
-            if maybe_rabbit_response is not None:
-                return self.get_response(maybe_rabbit_response)
-
-            time.sleep(0.1)
-
-        # timeout
-        return Response(status=500, headers={'rabbit_timeout': HTTP_TIMEOUT_SECONDS})
-
-    def publish(self, content: dict):
-        with producers[self.connection].acquire(block=False) as producer:
-            producer: Producer
-            producer.publish(content,
-                             exchange=definitions.main_exchange,
-                             routing_key='event.copy',
-                             headers={'client_id': definitions.client_id})
\ No newline at end of file
+        slash, first, *other = location.split('/', 2)
+        destination = first if prefix == ANY_PREFIX else PREFIX_TO_DESTINATION[prefix]
+
+        parsed = parsed\
+            ._replace(netloc=destination)\
+            ._replace(path=other[0] if other else '')
+        return parsed.geturl()
+
+    def response_parts(self, rabbit_response: HttpResponse) -> tuple[int, dict, bytes]:
+        # -1 means the destination could not be reached
+        status_code = rabbit_response['status_code'] if rabbit_response['status_code'] > 0 else 502
+        headers = self.end_to_end_headers(rabbit_response['headers'], RESPONSE_DROPPED_HEADERS)
+        return status_code, headers, bytes(as_bytes(rabbit_response['body']))
+
+    @staticmethod
+    def end_to_end_headers(headers: dict, dropped: set[str] = HOP_BY_HOP_HEADERS) -> dict:
+        return {name: value for name, value in headers.items() if name.lower() not in dropped}
+
+    def publish_request(self, rabbit_request: HttpRequest):
+        """To the work queue of its prefix, one of the clients serving it executes the request"""
+        declare = [body_queue(rabbit_request['correlation_id'])] if rabbit_request.get('body_streamed') else None
+        self.publish(rabbit_request, http_exchange, rabbit_request['prefix'], declare=declare)
+
+    def publish_request_chunk(self, chunk: HttpBody):
+        self.publish(chunk, http_exchange, body_queue(chunk['correlation_id']).routing_key)
+
+    def publish(self, content: dict, exchange: Exchange = None, routing_key: str = 'event.http', to: str = None,
+                declare: list = None, producer: Producer = None):
+        if exchange is None:
+            # the main exchange always exists, the one of a peer only while the peer is connected
+            exchange = definitions.main_exchange if to is None else definitions.peer_exchange(to)
+        elif declare is None:
+            declare = [exchange]
+
+        if producer is None:
+            # front end threads and upstream workers take turns, the rest of the producer pool stays free for others
+            if not self.publish_slots.acquire(timeout=PUBLISH_TIMEOUT_SECONDS):
+                raise LimitExceeded(f'No http publisher free after {PUBLISH_TIMEOUT_SECONDS}s')
+            try:
+                with producers[self.connection].acquire(block=True, timeout=PUBLISH_TIMEOUT_SECONDS) as producer:
+                    return self.publish(content, exchange, routing_key, to, declare, producer)
+            finally:
+                self.publish_slots.release()
+
+        if to is not None and not definitions.peer_connected(producer.channel, to):
+            logging.info('Not sending %s, client %s left', content['event_type'], to)
+            return
+
+        producer.publish(content,
+                         exchange=exchange,
+                         routing_key=routing_key,
+                         headers={'client_id': definitions.client_id},
+                         declare=declare,
+                         serializer=codec.negotiated(to),
+                         compression=compression.for_event(content))
\ No newline at end of file
@@ -0,0 +1,155 @@
+import dataclasses
+import logging
+import threading
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Optional, Callable
+
+from .config import PENDING_TTL_SECONDS, PENDING_MAX_SIZE
+from .events import *
+
+
+@dataclasses.dataclass
+class PendingRequest:
+    correlation_id: str
+    created_on: float
+    # called when the request is answered, expired or evicted, e.g. to wake an event loop instead of a thread
+    on_done: Optional[Callable[['PendingRequest'], None]] = None
+    # called with every chunk of a streamed response body after the first one
+    on_chunk: Optional[Callable[[HttpBody], None]] = None
+    done: threading.Event = dataclasses.field(default_factory=threading.Event)
+    # None until answered, stays None when the request expired or was evicted
+    response: Optional[HttpResponse] = None
+    # body chunks that overtook the response, published on another channel
+    early_chunks: list[HttpBody] = dataclasses.field(default_factory=list)
+
+    def finish(self, response: Optional[HttpResponse] = None):
+        self.response = response
+        self.done.set()
+        if self.on_done is not None:
+            self.on_done(self)
+
+
+class PendingRequests:
+    """
+    Proxied requests waiting for their response, by correlation id.
+    Every waiter blocks on its own event or gets a callback when the response arrives, responses nobody waits for
+    (late, answered by another client already or meant for another client) are dropped.
+    """
+
+    def __init__(self, ttl: float = PENDING_TTL_SECONDS, max_size: int = PENDING_MAX_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.requests: OrderedDict[str, PendingRequest] = OrderedDict()
+        # answered requests whose response body is still coming
+        self.streams: OrderedDict[str, PendingRequest] = OrderedDict()
+        self.lock = Lock()
+
+    def add(self, correlation_id: str, on_done: Callable[[PendingRequest], None] = None,
+            on_chunk: Callable[[HttpBody], None] = None) -> PendingRequest:
+        """Register before publishing the request, so a fast response is not lost"""
+        pending = PendingRequest(correlation_id, time.monotonic(), on_done, on_chunk)
+        with self.lock:
+            self.expire(pending.created_on)
+            self.requests[correlation_id] = pending
+            while len(self.requests) > self.max_size:
+                _, evicted = self.requests.popitem(last=False)
+                evicted.finish()
+        return pending
+
+    def complete(self, response: HttpResponse) -> bool:
+        evicted = None
+        early_chunks = []
+        with self.lock:
+            pending = self.requests.pop(response['correlation_id'], None)
+            if pending is not None and response.get('streamed') and pending.on_chunk is not None:
+                self.streams[pending.correlation_id] = pending
+                early_chunks, pending.early_chunks = pending.early_chunks, []
+                if len(self.streams) > self.max_size:
+                    _, evicted = self.streams.popitem(last=False)
+        if evicted is not None:
+            evicted.on_chunk(aborted_chunk(evicted.correlation_id))
+        if pending is None:
+            logging.debug('Dropping response to %s, nobody waits for it', response['correlation_id'])
+            return False
+
+        pending.finish(response)
+        for chunk in early_chunks:
+            pending.on_chunk(chunk)
+        return True
+
+    def feed(self, chunk: HttpBody) -> bool:
+        with self.lock:
+            # the reader discards the stream, the last chunk may overtake others
+            pending = self.streams.get(chunk['correlation_id'])
+            if pending is None:
+                waiting = self.requests.get(chunk['correlation_id'])
+                if waiting is not None and waiting.on_chunk is not None:
+                    # the response is still on its way, the reader gets the chunk with it
+                    waiting.early_chunks.append(chunk)
+                    return True
+        if pending is None:
+            logging.debug('Dropping body of %s, nobody reads it', chunk['correlation_id'])
+            return False
+
+        pending.on_chunk(chunk)
+        return True
+
+    def wait(self, pending: PendingRequest, timeout: float) -> Optional[HttpResponse]:
+        pending.done.wait(timeout)
+        with self.lock:
+            if self.requests.get(pending.correlation_id) is pending:
+                del self.requests[pending.correlation_id]
+        return pending.response
+
+    def discard(self, pending: PendingRequest):
+        """Forget the request and the rest of its body, when its waiter gave up or read everything"""
+        with self.lock:
+            for requests in (self.requests, self.streams):
+                if requests.get(pending.correlation_id) is pending:
+                    del requests[pending.correlation_id]
+
+    def expire(self, now: float):
+        # oldest first, expired requests are always at the front
+        while self.requests:
+            correlation_id, pending = next(iter(self.requests.items()))
+            if now - pending.created_on < self.ttl:
+                break
+            del self.requests[correlation_id]
+            pending.finish()
+
+
+class InOrder:
+    """
+    Chunks of one body in seq order.
+    Chunks published on different channels can overtake each other, those that come early wait for the ones before.
+    """
+
+    def __init__(self):
+        self.seq = 1
+        self.early: dict[int, HttpBody] = dict()
+
+    def add(self, chunk: HttpBody) -> list[HttpBody]:
+        """Chunks that are next in order now, an aborted chunk right away"""
+        if chunk.get('aborted'):
+            return [chunk]
+        if chunk['seq'] >= self.seq:
+            self.early[chunk['seq']] = chunk
+
+        ready = []
+        while self.seq in self.early:
+            ready.append(self.early.pop(self.seq))
+            self.seq += 1
+        return ready
+
+
+def aborted_chunk(correlation_id: str) -> HttpBody:
+    return {
+        'event_type': EVENT_TYPE_HTTP_BODY,
+        'correlation_id': correlation_id,
+        'seq': -1,
+        'content': b'',
+        'last': True,
+        'aborted': True,
+    }
@@ -0,0 +1,75 @@
+"""
+Routing of proxied requests to a single client that can reach their destination.
+
+Clients advertise the prefixes they have destinations for in ping/pong and consume a work queue per prefix,
+a request is published to the queue of its prefix once and the broker hands it to one of the consumers.
+Clients that accept urls without a prefix also serve ANY_PREFIX, requests to hosts given directly in the url.
+"""
+from threading import Lock
+from typing import Optional
+from urllib.parse import urlparse
+
+from kombu import Exchange, Queue
+
+from rabbitmq_sync import definitions
+from .config import PREFIX_TO_DESTINATION, ONLY_WITH_PREFIX, HTTP_TIMEOUT_SECONDS
+
+http_exchange = Exchange('sync-http', 'direct')
+ANY_PREFIX = '*'
+# body queues nobody consumed are removed by the broker
+BODY_QUEUE_EXPIRES_SECONDS = HTTP_TIMEOUT_SECONDS * 2
+
+
+def served_prefixes() -> list[str]:
+    prefixes = list(PREFIX_TO_DESTINATION)
+    if not ONLY_WITH_PREFIX:
+        prefixes.append(ANY_PREFIX)
+    return prefixes
+
+
+def work_queue(prefix: str) -> Queue:
+    """Shared by every client serving prefix, competing consumers balance requests between them"""
+    return Queue(f'q-sync-http-{prefix}', exchange=http_exchange, routing_key=prefix, auto_delete=True)
+
+
+def body_queue(correlation_id: str) -> Queue:
+    """Rest of a request body, read by whichever client took the request"""
+    return Queue(f'q-sync-http-body-{correlation_id}', exchange=http_exchange, routing_key=f'body.{correlation_id}',
+                 auto_delete=True, expires=BODY_QUEUE_EXPIRES_SECONDS)
+
+
+def url_prefix(url: str) -> str:
+    """First segment of the url path"""
+    parts = urlparse(url).path.split('/', 2)
+    return parts[1] if len(parts) > 1 else ''
+
+
+class Executors:
+    """Prefixes served by known clients, this one included"""
+
+    def __init__(self):
+        self.prefixes: dict[str, set[str]] = {definitions.client_id: set(served_prefixes())}
+        self.lock = Lock()
+
+    def on_peer(self, client_id: str, prefixes: Optional[list[str]]):
+        with self.lock:
+            self.prefixes[client_id] = set(prefixes or ())
+
+    def forget(self, client_id: str):
+        """Departed clients serve nothing, requests for their prefixes only are no longer routed"""
+        if client_id == definitions.client_id:
+            return
+        with self.lock:
+            self.prefixes.pop(client_id, None)
+
+    def route(self, url: str) -> Optional[str]:
+        """Prefix to publish a request for url with, None when no client can reach it"""
+        with self.lock:
+            served = set().union(*self.prefixes.values())
+
+        prefix = url_prefix(url)
+        if prefix in served:
+            return prefix
+        if ANY_PREFIX in served:
+            return ANY_PREFIX
+        return None
@@ -0,0 +1,155 @@
+"""
+Front ends accepting the requests to proxy.
+
+waitress serves the flask app on a pool of threads, every request waiting for its response holds one of them.
+The asyncio server waits for responses on an event loop instead, so in-flight requests cost no thread.
+It speaks just enough HTTP/1.1 for proxying: Content-Length and chunked request bodies, keep-alive and 100-continue,
+bodies are passed on in pieces as they arrive in both directions.
+"""
+import asyncio
+import logging
+from http import HTTPStatus
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+import waitress
+from flask import Flask
+
+from .config import SERVER_THREADS, BODY_CHUNK_SIZE
+
+# request head with all headers
+MAX_HEAD_SIZE = 64 * 1024
+
+Body = bytes | AsyncIterator[bytes]
+# (method, url, headers, body) -> (status code, headers, body)
+AsyncHandler = Callable[[str, str, dict, AsyncIterator[bytes]], Awaitable[tuple[int, dict, Body]]]
+
+
+def serve_waitress(app: Flask, host: str, port: int, threads: int = SERVER_THREADS):
+    waitress.serve(app, host=host, port=port, threads=threads)
+
+
+class AsyncioServer:
+    def __init__(self, handler: AsyncHandler, host: str, port: int):
+        self.handler = handler
+        self.host = host
+        self.port = port
+
+    def run(self):
+        asyncio.run(self.serve())
+
+    async def serve(self):
+        server = await asyncio.start_server(self.on_connection, self.host, self.port, limit=MAX_HEAD_SIZE)
+        async with server:
+            await server.serve_forever()
+
+    async def on_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request = await self.read_request(reader, writer)
+                if request is None:
+                    break
+
+                method, target, version, headers = request
+                body = self.iter_body(reader, headers)
+                host = headers.get('Host', f'{self.host}:{self.port}')
+                status_code, response_headers, response_body = await self.handler(
+                    method, f'http://{host}{target}', headers, body)
+
+                keep_alive = version == 'HTTP/1.1' and headers.get('Connection', '').lower() != 'close'
+                await self.write_response(writer, status_code, response_headers, response_body, keep_alive)
+
+                # whatever the handler did not read, the next request starts after it
+                async for _ in body:
+                    pass
+
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, ValueError) as e:
+            logging.debug('Dropping http connection: %r', e)
+        except Exception:
+            logging.exception('Dropping http connection')
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def read_request(reader: asyncio.StreamReader,
+                           writer: asyncio.StreamWriter) -> Optional[tuple[str, str, str, dict]]:
+        """None when the client closed the connection between requests"""
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+        except asyncio.IncompleteReadError as e:
+            if not e.partial:
+                return None
+            raise
+
+        request_line, *header_lines = head.decode('latin-1').rstrip('\r\n').split('\r\n')
+        method, target, version = request_line.split(' ', 2)
+
+        headers = dict()
+        for line in header_lines:
+            name, _, value = line.partition(':')
+            name = '-'.join(part.capitalize() for part in name.strip().split('-'))
+            # repeated headers are combined like werkzeug does
+            headers[name] = f'{headers[name]}, {value.strip()}' if name in headers else value.strip()
+
+        if headers.get('Expect', '').lower() == '100-continue':
+            writer.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+
+        return method, target, version, headers
+
+    @staticmethod
+    async def iter_body(reader: asyncio.StreamReader, headers: dict) -> AsyncIterator[bytes]:
+        """Request body in pieces of at most BODY_CHUNK_SIZE bytes"""
+        if 'chunked' not in headers.get('Transfer-Encoding', '').lower():
+            remaining = int(headers.get('Content-Length', 0))
+            while remaining > 0:
+                block = await reader.readexactly(min(remaining, BODY_CHUNK_SIZE))
+                remaining -= len(block)
+                yield block
+            return
+
+        while True:
+            size_line = await reader.readuntil(b'\r\n')
+            size = int(size_line.split(b';', 1)[0], 16)
+            if size == 0:
+                # trailers until an empty line
+                while await reader.readuntil(b'\r\n') != b'\r\n':
+                    pass
+                return
+
+            while size > 0:
+                block = await reader.readexactly(min(size, BODY_CHUNK_SIZE))
+                size -= len(block)
+                yield block
+            await reader.readexactly(2)
+
+    @staticmethod
+    async def write_response(writer: asyncio.StreamWriter, status_code: int, headers: dict, body: Body,
+                             keep_alive: bool):
+        """bytes are sent with Content-Length, iterators with chunked encoding as their pieces come"""
+        lines = [f'HTTP/1.1 {status_code} {reason(status_code)}']
+        lines += [f'{name}: {value}' for name, value in headers.items()]
+        if isinstance(body, bytes):
+            lines.append(f'Content-Length: {len(body)}')
+        else:
+            lines.append('Transfer-Encoding: chunked')
+        lines.append(f'Connection: {"keep-alive" if keep_alive else "close"}')
+
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        if isinstance(body, bytes):
+            writer.write(body)
+            return await writer.drain()
+
+        async for block in body:
+            if block:
+                writer.write(b'%x\r\n%b\r\n' % (len(block), block))
+                await writer.drain()
+        writer.write(b'0\r\n\r\n')
+        await writer.drain()
+
+
+def reason(status_code: int) -> str:
+    try:
+        return HTTPStatus(status_code).phrase
+    except ValueError:
+        return 'Unknown'
@@ -0,0 +1,100 @@
+import logging
+from http.cookiejar import DefaultCookiePolicy
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock, BoundedSemaphore
+from typing import Callable, Iterator, Optional
+from urllib.parse import urlparse
+
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+
+from .config import (
+    UPSTREAM_POOL_SIZE,
+    UPSTREAM_CONNECT_TIMEOUT_SECONDS,
+    UPSTREAM_READ_TIMEOUT_SECONDS,
+    UPSTREAM_WORKERS,
+    UPSTREAM_QUEUE_SIZE,
+)
+
+
+class StreamedBody:
+    """Request body read while it is sent, sent with Content-Length when its size is known and chunked otherwise"""
+
+    def __init__(self, chunks: Iterator[bytes], size: Optional[int] = None):
+        self.chunks = chunks
+        self.size = size
+
+    def __iter__(self):
+        return self.chunks
+
+    def __len__(self):
+        return self.size if self.size is not None else 0
+
+    def __bool__(self):
+        # requests drops falsy data, an empty length does not mean an empty body
+        return True
+
+
+def iter_body(response: requests.Response, chunk_size: int) -> Iterator[bytes]:
+    """Response body in pieces as they arrive, iter_content would hold them back until chunk_size bytes are read"""
+    try:
+        while block := response.raw.read1(chunk_size, decode_content=True):
+            yield block
+    except urllib3.exceptions.HTTPError as e:
+        raise requests.exceptions.ChunkedEncodingError(e)
+
+
+class Upstream:
+    """
+    Performs proxied requests on a bounded thread pool, off the consumer thread.
+    Every destination gets its own session, connections to it are kept alive and reused.
+    """
+
+    def __init__(self, workers: int = UPSTREAM_WORKERS, queue_size: int = UPSTREAM_QUEUE_SIZE):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='http-upstream')
+        # requests running or waiting for a worker
+        self.slots = BoundedSemaphore(workers + queue_size)
+        self.sessions: dict[str, requests.Session] = dict()
+        self.lock = Lock()
+
+    def submit(self, func: Callable, *args) -> bool:
+        """Returns False right away when all workers are busy and the queue is full"""
+        if not self.slots.acquire(blocking=False):
+            return False
+
+        def run():
+            try:
+                func(*args)
+            except Exception:
+                logging.exception('Upstream request failed')
+            finally:
+                self.slots.release()
+
+        self.executor.submit(run)
+        return True
+
+    def request(self, method: str, url: str, headers: dict, body: 'bytes | StreamedBody') -> requests.Response:
+        """The response body is read as it is consumed, close the response when done"""
+        return self.session(url).request(
+            method,
+            url,
+            headers=headers,
+            data=body,
+            stream=True,
+            timeout=(UPSTREAM_CONNECT_TIMEOUT_SECONDS, UPSTREAM_READ_TIMEOUT_SECONDS))
+
+    def session(self, url: str) -> requests.Session:
+        parsed = urlparse(url)
+        destination = f'{parsed.scheme}://{parsed.netloc}'
+
+        with self.lock:
+            session = self.sessions.get(destination)
+            if session is None:
+                session = self.sessions[destination] = requests.Session()
+                # sessions are shared by everybody using the proxy, cookies of one caller must not leak to others
+                session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=UPSTREAM_POOL_SIZE)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+        return session
@@ -1,10 +1,26 @@
+import logging
+import time
 from typing import Callable
 
-from kombu import Connection, Message
+from kombu import Connection, Consumer, Message
 from kombu.mixins import ConsumerProducerMixin
-from . import definitions
+from . import definitions, compression, codec
+from .codec import ACCEPT_CONTENT
 from .definitions import main_queue, main_exchange
-from .events import BaseEvent, PingPong, EVENT_TYPE_PING, EVENT_TYPE_PONG, EVENT_INTERNAL_READY
+from .settings import PING_INTERVAL_SECONDS, PEER_TIMEOUT_SECONDS
+from .events import (
+    BaseEvent,
+    PingPong,
+    Requeue,
+    EVENT_TYPE_PING,
+    EVENT_TYPE_PONG,
+    EVENT_INTERNAL_READY,
+    EVENT_INTERNAL_ADVERTISE,
+    EVENT_INTERNAL_QUEUES,
+    EVENT_INTERNAL_PREFETCH,
+    EVENT_INTERNAL_PEER_GONE,
+    INTERNAL_HOOKS,
+)
 
 HandlersType = list[dict[str, Callable[[BaseEvent], None]]]
 
@@ -12,40 +28,104 @@ HandlersType = list[dict[str, Callable[[BaseEvent], None]]]
 class Worker(ConsumerProducerMixin):
     def __init__(self, connection: Connection, handlers: HandlersType):
         self.connection = connection
-        self.handlers = handlers
+        # hooks the worker calls itself are kept apart from handlers of received events,
+        # a message named like a hook never reaches it
+        self.handlers = [{name: func for name, func in handler.items() if name not in INTERNAL_HOOKS}
+                         for handler in handlers]
+        self.hooks = [{name: func for name, func in handler.items() if name in INTERNAL_HOOKS}
+                      for handler in handlers]
 
-        self.active_clients = set()
+        # client id -> monotonic time it was last heard from
+        self.active_clients: dict[str, float] = dict()
+        self.pinged_on = 0.
 
     def on_consume_ready(self, connection, channel, consumers, **kwargs):
         self.ping()
 
-        self.process_handlers({
+        self.process_hooks({
             'event_type': EVENT_INTERNAL_READY
         })
 
+    def on_iteration(self):
+        now = time.monotonic()
+        if now - self.pinged_on >= PING_INTERVAL_SECONDS:
+            self.ping()
+
+        for client_id, seen_on in list(self.active_clients.items()):
+            if now - seen_on > PEER_TIMEOUT_SECONDS:
+                self.forget_peer(client_id)
+
+    def forget_peer(self, client_id: str):
+        logging.info('Client %s is gone', client_id)
+        del self.active_clients[client_id]
+        compression.forget_peer(client_id)
+        codec.forget_peer(client_id)
+        self.process_hooks({
+            'event_type': EVENT_INTERNAL_PEER_GONE,
+            'client_id': client_id,
+        })
+
     def ping(self):
+        self.pinged_on = time.monotonic()
         ping: PingPong = {
             'event_type': EVENT_TYPE_PING,
-            'pong': False
+            'pong': False,
+            **self.advertisement(),
         }
 
         self.producer.publish(ping,
                               exchange=main_exchange,
                               routing_key=PingPong.__name__,
-                              headers={'client_id': definitions.client_id})
+                              headers={'client_id': definitions.client_id},
+                              # read by every client, whatever serializers it knows
+                              serializer=codec.JSON_NAME)
+
+    def advertisement(self) -> dict:
+        fields = {'encodings': compression.SUPPORTED_ENCODINGS, 'serializers': codec.SUPPORTED_SERIALIZERS}
+        for hooks in self.hooks:
+            advertise = hooks.get(EVENT_INTERNAL_ADVERTISE)
+            if advertise is not None:
+                fields.update(advertise())
+        return fields
 
     def get_consumers(self, consumer_class, channel):
-        return [consumer_class(main_queue, callbacks=[self.on_message])]
+        consumers = [consumer_class([main_queue], callbacks=[self.on_message], accept=ACCEPT_CONTENT)]
+        for hooks in self.hooks:
+            handler_queues = hooks.get(EVENT_INTERNAL_QUEUES)
+            if handler_queues is None:
+                continue
+
+            prefetch = hooks.get(EVENT_INTERNAL_PREFETCH)
+            # a channel of their own, the prefetch limit applies to every consumer of a channel
+            consumers.append(Consumer(channel.connection.client.channel(),
+                                      queues=handler_queues(),
+                                      callbacks=[self.on_message],
+                                      accept=ACCEPT_CONTENT,
+                                      prefetch_count=prefetch() if prefetch is not None else None,
+                                      on_decode_error=self.on_decode_error))
+        return consumers
 
     def on_message(self, body: BaseEvent, message: Message):
         print(body, message)
 
+        if message.headers.get('client_id') is not None:
+            body['client_id'] = message.headers['client_id']
+            self.active_clients[body['client_id']] = time.monotonic()
+
         if body['event_type'] == EVENT_TYPE_PING:
-            self.on_ping()
+            self.on_ping(body, message)
         elif body['event_type'] == EVENT_TYPE_PONG:
-            self.on_pong(message)
+            self.on_pong(body, message)
 
-        self.process_handlers(body)
+        if message.delivery_info.get('redelivered'):
+            body['redelivered'] = True
+
+        try:
+            self.process_handlers(body)
+        except Requeue as e:
+            logging.info('Requeueing %s: %s', body['event_type'], e)
+            message.requeue()
+            return
 
         message.ack()
 
@@ -55,16 +135,33 @@ class Worker(ConsumerProducerMixin):
             if handler_func is not None:
                 handler_func(event)
 
-    def on_ping(self):
+    def process_hooks(self, event: BaseEvent):
+        for hooks in self.hooks:
+            hook = hooks.get(event['event_type'])
+            if hook is not None:
+                hook(event)
+
+    def on_ping(self, body: PingPong, message: Message):
+        client_id = message.headers['client_id']
+        compression.on_peer(client_id, body.get('encodings'))
+        codec.on_peer(client_id, body.get('serializers'))
+
+        # only the pinging client needs the answer, everybody else got the ping too
+        if not definitions.peer_connected(self.producer.channel, client_id):
+            return
+
         pong: PingPong = {
             'event_type': EVENT_TYPE_PONG,
-            'pong': True
+            'pong': True,
+            **self.advertisement(),
         }
-        print('publish')
+
         self.producer.publish(pong,
-                              exchange=main_exchange,
+                              exchange=definitions.peer_exchange(client_id),
                               routing_key='event',
-                              headers={'client_id': definitions.client_id})
+                              headers={'client_id': definitions.client_id},
+                              serializer=codec.JSON_NAME)
 
-    def on_pong(self, message: Message):
-        self.active_clients.add(message.headers['client_id'])
+    def on_pong(self, body: PingPong, message: Message):
+        compression.on_peer(message.headers['client_id'], body.get('encodings'))
+        codec.on_peer(message.headers['client_id'], body.get('serializers'))
@@ -0,0 +1,27 @@
+import configparser
+
+config = configparser.ConfigParser()
+config.read('rabbit_sync.ini')
+
+# example
+#
+# [main]
+# serializer = rabbit-sync
+# compression = zlib, lzma
+# ping_interval = 30
+# peer_timeout = 90
+
+# rabbit-sync to use the binary codec with clients that advertise it too, or json to never use it,
+# json is sent by codec.JSON_NAME with payloads base64 encoded like clients without the codec expect
+SERIALIZER = config.get('main', 'serializer', fallback='rabbit-sync')
+
+# compression codecs for payloads in order of preference: zlib, lzma or empty to disable
+COMPRESSION = [c.strip() for c in config.get('main', 'compression', fallback='zlib, lzma').split(',') if c.strip()]
+# payloads smaller than this are sent uncompressed
+COMPRESSION_MIN_SIZE = config.getint('main', 'compression_min_size', fallback=1024)
+# sampled bits of entropy per byte above which a payload is considered already compressed
+COMPRESSION_MAX_ENTROPY = config.getfloat('main', 'compression_max_entropy', fallback=7.5)
+
+# clients ping each other this often, a client not heard from for peer_timeout is considered gone
+PING_INTERVAL_SECONDS = config.getfloat('main', 'ping_interval', fallback=30.)
+PEER_TIMEOUT_SECONDS = config.getfloat('main', 'peer_timeout', fallback=PING_INTERVAL_SECONDS * 3)
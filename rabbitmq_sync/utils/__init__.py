@@ -1 +1,2 @@
 from .diff import git_diff_resolve
+from .hashing import bytes_hash, file_hash, read_with_hash
@@ -0,0 +1,148 @@
+"""
+rsync-like delta encoding.
+
+The side that has an old version sends a signature: weak rolling and strong checksums of fixed-size blocks.
+The side that has the new version slides a window over it and replies with instructions
+to copy blocks the other side already has and literal bytes for everything else.
+"""
+import base64
+import hashlib
+import math
+import zlib
+from typing import TypedDict, Union
+
+MIN_BLOCK_SIZE = 512
+MAX_BLOCK_SIZE = 64 * 1024
+ADLER_MOD = 65521
+
+# ['copy', first block, block count] or ['literal', bytes]
+DeltaOp = list[Union[str, int]]
+
+
+class Signature(TypedDict):
+    block_size: int
+    size: int
+    # [weak, strong] for every block, the last block can be shorter
+    blocks: list[list[Union[int, str]]]
+
+
+def block_size_for(size: int) -> int:
+    # same heuristic as rsync, about sqrt(size) blocks of sqrt(size) bytes
+    return min(MAX_BLOCK_SIZE, max(MIN_BLOCK_SIZE, int(math.sqrt(size)) & ~7))
+
+
+def strong_hash(block: bytes) -> str:
+    return hashlib.md5(block, usedforsecurity=False).hexdigest()[:16]
+
+
+def signature(data: bytes, block_size: int = None) -> Signature:
+    block_size = block_size or block_size_for(len(data))
+    blocks = []
+
+    view = memoryview(data)
+    for start in range(0, len(data), block_size):
+        block = view[start:start + block_size]
+        blocks.append([zlib.adler32(block), strong_hash(block)])
+
+    return {
+        'block_size': block_size,
+        'size': len(data),
+        'blocks': blocks,
+    }
+
+
+def delta(data: bytes, base_signature: Signature) -> list[DeltaOp]:
+    block_size = base_signature['block_size']
+    blocks = base_signature['blocks']
+
+    last_index = len(blocks) - 1
+    tail_size = base_signature['size'] - last_index * block_size
+    has_tail = bool(blocks) and tail_size < block_size
+
+    full_blocks = dict()
+    for index, (weak, strong) in enumerate(blocks):
+        if index == last_index and has_tail:
+            continue
+        full_blocks.setdefault(weak, dict()).setdefault(strong, index)
+
+    builder = DeltaBuilder(data)
+    view = memoryview(data)
+    size = len(data)
+    position = 0
+
+    if size >= block_size and full_blocks:
+        weak = zlib.adler32(view[:block_size])
+        a, b = weak & 0xffff, weak >> 16
+
+        while position + block_size <= size:
+            candidates = full_blocks.get((b << 16) | a)
+            if candidates is not None:
+                index = candidates.get(strong_hash(view[position:position + block_size]))
+                if index is not None:
+                    builder.copy(position, index, block_size)
+                    position += block_size
+                    if position + block_size <= size:
+                        weak = zlib.adler32(view[position:position + block_size])
+                        a, b = weak & 0xffff, weak >> 16
+                    continue
+
+            if position + block_size < size:
+                removed = data[position]
+                added = data[position + block_size]
+                a = (a - removed + added) % ADLER_MOD
+                b = (b - block_size * removed + a - 1) % ADLER_MOD
+            position += 1
+
+    # a shorter last block can only match at the very end
+    tail_start = size - tail_size
+    if has_tail and tail_start >= builder.literal_start and strong_hash(view[tail_start:]) == blocks[last_index][1]:
+        builder.copy(tail_start, last_index, tail_size)
+
+    return builder.finish()
+
+
+class DeltaBuilder:
+    def __init__(self, data: bytes):
+        self.data = data
+        self.ops: list[DeltaOp] = []
+        self.literal_start = 0
+
+    def copy(self, position: int, index: int, size: int):
+        if position > self.literal_start:
+            self.literal(self.literal_start, position)
+
+        last = self.ops[-1] if self.ops else None
+        if last is not None and last[0] == 'copy' and last[1] + last[2] == index:
+            last[2] += 1
+        else:
+            self.ops.append(['copy', index, 1])
+
+        self.literal_start = position + size
+
+    def literal(self, start: int, end: int):
+        self.ops.append(['literal', self.data[start:end]])
+
+    def finish(self) -> list[DeltaOp]:
+        if self.literal_start < len(self.data):
+            self.literal(self.literal_start, len(self.data))
+            self.literal_start = len(self.data)
+        return self.ops
+
+
+def patch(base: bytes, block_size: int, ops: list[DeltaOp]) -> bytes:
+    result = bytearray()
+    view = memoryview(base)
+
+    for op in ops:
+        if op[0] == 'copy':
+            _, index, count = op
+            result += view[index * block_size:(index + count) * block_size]
+        else:
+            # older clients send literals base64 encoded
+            result += base64.b64decode(op[1]) if isinstance(op[1], str) else op[1]
+
+    return bytes(result)
+
+
+def literal_size(ops: list[DeltaOp]) -> int:
+    return sum(len(op[1]) for op in ops if op[0] == 'literal')
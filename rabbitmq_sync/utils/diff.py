@@ -1,101 +1,95 @@
-import dataclasses
-from typing import Literal
-import myers
-from myers import KEEP, INSERT, REMOVE
+from typing import Iterator, Literal, Sequence
+
+from .diff_engine import KEEP, INSERT, REMOVE, DEFAULT_ALGORITHM, Op, diff, iter_lines
+
+# kept lines are rendered this many at a time, bounds the size of rendered pieces
+RENDER_BATCH_LINES = 1024
+
+# (lines, start, end) slice of a or b without copying it
+Segment = tuple[Sequence[str], int, int]
 
 
-@dataclasses.dataclass
 class LineBlock:
-    lines: list[str] = dataclasses.field(default_factory=list)
+    """Run of kept lines, every line is followed by a newline"""
+    __slots__ = ('lines', 'start', 'end')
 
-    def append(self, line: str):
-        self.lines.append(line)
+    def __init__(self, lines: Sequence[str], start: int, end: int):
+        self.lines = lines
+        self.start = start
+        self.end = end
 
-    def render(self):
-        return "\n".join(self.lines)
+    def render(self) -> Iterator[str]:
+        for batch_start in range(self.start, self.end, RENDER_BATCH_LINES):
+            batch = self.lines[batch_start:min(batch_start + RENDER_BATCH_LINES, self.end)]
+            batch.append('')
+            yield '\n'.join(batch)
 
 
-@dataclasses.dataclass
-class ConflictBlock(LineBlock):
-    diff_lines: list[str] = dataclasses.field(default_factory=list)
-    insert_diff: bool = False
-    diff_postfix: str = None
-    auto_resolve: bool = False
-    resolve_for_this: bool = True
+class ConflictBlock:
+    """Lines of both sides of a change, rendered as a conflict or as one side when only one side has content"""
+    __slots__ = ('this', 'other', 'diff_postfix', 'auto_resolve', 'resolve_for_this')
 
-    def append(self, line: str):
-        (self.diff_lines if self.insert_diff else self.lines).append(line)
+    def __init__(self, diff_postfix: str = None, auto_resolve: bool = False, resolve_for_this: bool = True):
+        self.this: list[Segment] = []
+        self.other: list[Segment] = []
+        self.diff_postfix = diff_postfix
+        self.auto_resolve = auto_resolve
+        self.resolve_for_this = resolve_for_this
 
-    @staticmethod
-    def join(collection):
-        return "\n".join(collection)
+    def add(self, to_other: bool, lines: Sequence[str], start: int, end: int):
+        if start < end:
+            (self.other if to_other else self.this).append((lines, start, end))
 
-    def render(self):
-        has_conflict = any(self.lines) and any(self.diff_lines)
+    @staticmethod
+    def iter_lines(segments: list[Segment]) -> Iterator[str]:
+        for lines, start, end in segments:
+            for i in range(start, end):
+                yield lines[i]
+
+    def render(self) -> Iterator[str]:
+        # empty lines alone are no conflict
+        has_conflict = any(self.iter_lines(self.this)) and any(self.iter_lines(self.other))
         if self.auto_resolve and not has_conflict:
             return self.render_resolve()
         return self.render_diff()
 
-    def render_diff(self):
-        result = [self.diff_line_for('<')]
-        if self.lines:
-            result.append(self.join(self.lines))
-        result.append('=======')
-        if self.diff_lines:
-            result.append(self.join(self.diff_lines))
-        result.append(self.diff_line_for('>'))
-
-        return "\n".join(result)
+    def render_diff(self) -> Iterator[str]:
+        yield self.diff_line_for('<')
+        if self.this:
+            yield '\n'
+            yield from self.join(self.this)
+        yield '\n======='
+        if self.other:
+            yield '\n'
+            yield from self.join(self.other)
+        yield '\n'
+        yield self.diff_line_for('>')
 
     def diff_line_for(self, symbol: str):
         return symbol * 7 + (f' {self.diff_postfix}'.rstrip())
 
-    def render_resolve(self):
-        if self.resolve_for_this:
-            return self.join(self.lines)
-        return self.join(self.diff_lines)
+    def render_resolve(self) -> Iterator[str]:
+        return self.join(self.this if self.resolve_for_this else self.other)
 
+    def join(self, segments: list[Segment]) -> Iterator[str]:
+        first = True
+        for line in self.iter_lines(segments):
+            if not first:
+                yield '\n'
+            yield line
+            first = False
 
-def git_diff_resolve(a: str | list, b: str | list, auto_resolve: Literal['a', 'b'] | str = None, diff_postfix=None) -> str:
-    if isinstance(a, str):
-        a = a.split('\n')
-    if isinstance(b, str):
-        b = b.split('\n')
-
-    do_resolve = auto_resolve is not None
-    resolve_a = auto_resolve == 'a'
 
-    diffs = myers.diff(a, b)
+def iter_blocks(ops: list[Op], a: Sequence[str], b: Sequence[str],
+                auto_resolve: Literal['a', 'b'] | str = None, diff_postfix=None) -> Iterator[LineBlock | ConflictBlock]:
+    """
+    Blocks of runs of the edit script.
 
-    blocks = []
-
-    block_state = 0
-
-    def create_conflict_block(insert_diff: bool):
-        return ConflictBlock(
-            auto_resolve=do_resolve,
-            resolve_for_this=resolve_a,
-            insert_diff=insert_diff,
-            diff_postfix=diff_postfix)
-
-    def last_block():
-        return blocks[-1]
-
-    def render_blocks():
-        result = []
-        for block in blocks:
-            result.append(block.render())
-            if type(block) == LineBlock:
-                result.append('\n')
-
-        return ''.join(result)
-
-    '''
     States:
     0 - no diff block
     1 - A part
     2 - B part
-    
+
     0
     <<<<<<<
     1
@@ -103,47 +97,77 @@ def git_diff_resolve(a: str | list, b: str | list, auto_resolve: Literal['a', 'b
     2
     >>>>>>>
     0
-    '''
-    block_prev_action = KEEP
+    """
+    state = 0
+    block = None
 
-    for action, line in diffs:
+    def create_conflict_block():
+        return ConflictBlock(
+            diff_postfix=diff_postfix,
+            auto_resolve=auto_resolve is not None,
+            resolve_for_this=auto_resolve == 'a')
 
+    for action, start, end in ops:
         if action == KEEP:
-            block_state = 0
-            blocks.append(LineBlock())
-        elif block_state == 0 and action == REMOVE:
-            block_state = 1
-            blocks.append(create_conflict_block(insert_diff=False))
-        elif block_state == 0 and action == INSERT:
-            block_state = 2
-            blocks.append(create_conflict_block(insert_diff=True))
-        elif block_state == 1 and action != KEEP and action != block_prev_action:
-            last_block().insert_diff = True
-            block_state = 2
-        elif block_state == 1 and action == KEEP:
-            block_state = 0
-        elif block_state == 2 and (action == KEEP or action != block_prev_action):
-            block_state = 0
-
-        print(action, line, block_state)
+            if block is not None:
+                yield block
+                block = None
+            state = 0
+            yield LineBlock(a, start, end)
+            continue
+
+        if action == REMOVE and state == 2:
+            # the first line removed right after inserted ones still ends the B part
+            block.add(True, a, start, start + 1)
+            start += 1
+            state = 0
+
+        if start == end:
+            continue
+
+        if state == 0:
+            if block is not None:
+                yield block
+            block = create_conflict_block()
+
+        if action == REMOVE:
+            block.add(False, a, start, end)
+            state = 1
+        else:
+            block.add(True, b, start, end)
+            state = 2
+
+    if block is not None:
+        yield block
+
+
+def iter_git_diff_resolve(a: str | list, b: str | list, auto_resolve: Literal['a', 'b'] | str = None,
+                          diff_postfix=None, algorithm: str = DEFAULT_ALGORITHM) -> Iterator[str]:
+    """git_diff_resolve in pieces, for writing the result without holding all of it"""
+    if isinstance(a, str):
+        a = a.split('\n')
+    if isinstance(b, str):
+        b = b.split('\n')
 
-        last_block().append(line)
+    for block in iter_blocks(diff(a, b, algorithm), a, b, auto_resolve, diff_postfix):
+        yield from block.render()
 
-        block_prev_action = action
 
-    return render_blocks()
+def git_diff_resolve(a: str | list, b: str | list, auto_resolve: Literal['a', 'b'] | str = None, diff_postfix=None,
+                     algorithm: str = DEFAULT_ALGORITHM) -> str:
+    return ''.join(iter_git_diff_resolve(a, b, auto_resolve, diff_postfix, algorithm))
 
 
-def git_diff(a: str | list, b: str | list, a_name='', b_name='') -> str:
+def git_diff(a: str | list, b: str | list, a_name='', b_name='', algorithm: str = DEFAULT_ALGORITHM) -> str:
     if isinstance(a, str):
         a = a.split('\n')
     if isinstance(b, str):
         b = b.split('\n')
 
-    a.append('')
-    b.append('')
+    a = [*a, '']
+    b = [*b, '']
 
-    diffs = myers.diff(a, b)
+    diffs = iter_lines(diff(a, b, algorithm), a, b)
 
     lines = []
 
@@ -188,8 +212,6 @@ def git_diff(a: str | list, b: str | list, a_name='', b_name='') -> str:
             block_state = 0
             lines.append(block_end)
 
-        print(action, line, block_state)
-
         lines.append(line)
 
         block_prev_action = action
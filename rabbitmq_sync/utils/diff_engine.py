@@ -0,0 +1,398 @@
+"""
+Line diff engine.
+
+The common prefix and suffix are trimmed before any algorithm runs and the lines in between are interned
+to integers, so a small edit in a large file only diffs the few lines around it.
+
+ - myers: greedy O(ND) Myers, the edit script is the same as the one of the myers package used before.
+   Only the prefix is trimmed and nothing is interned, trimming the suffix would move some edits between equal lines
+ - myers-linear: linear-space Myers with middle snakes, minimal too but places edits differently
+ - patience: anchors on lines unique in both versions, myers between them
+ - histogram: anchors on the rarest common lines like git, myers for very repetitive regions
+
+A region that needs more than max_cost edits or takes longer than the timeout
+is reported as removed and inserted as a whole.
+"""
+import logging
+import time
+from bisect import bisect_left
+from itertools import chain
+from typing import Iterator, Sequence
+
+KEEP, INSERT, REMOVE = 'k', 'i', 'r'
+
+ALGORITHMS = ('myers', 'myers-linear', 'patience', 'histogram')
+DEFAULT_ALGORITHM = 'myers'
+# edits, the greedy myers keeps O(cost^2) of state
+MAX_EDIT_COST = 1000
+TIMEOUT_SECONDS = 2.
+# histogram diff falls back to myers when the rarest common line occurs more often than this
+MAX_CHAIN_LENGTH = 64
+SNAKE_STEP = 64
+
+# (action, start, end), KEEP and REMOVE are ranges of a, INSERT ranges of b
+Op = tuple[str, int, int]
+
+
+class DiffTooExpensive(Exception):
+    pass
+
+
+class Guard:
+    def __init__(self, max_cost: int = None, timeout: float = None):
+        self.max_cost = max_cost
+        self.deadline = time.monotonic() + timeout if timeout is not None else None
+
+    def check(self, cost: int):
+        if self.max_cost is not None and cost > self.max_cost:
+            raise DiffTooExpensive(f'more than {self.max_cost} edits')
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise DiffTooExpensive('timed out')
+
+
+class Script:
+    """Edit script as runs, adjacent ops of the same kind are merged"""
+
+    def __init__(self):
+        self.ops: list[Op] = []
+
+    def add(self, action: str, start: int, end: int):
+        if start >= end:
+            return
+        if self.ops:
+            last_action, last_start, last_end = self.ops[-1]
+            if last_action == action and last_end == start:
+                self.ops[-1] = (action, last_start, end)
+                return
+        self.ops.append((action, start, end))
+
+    def replace(self, a_lo: int, a_hi: int, b_lo: int, b_hi: int):
+        self.add(REMOVE, a_lo, a_hi)
+        self.add(INSERT, b_lo, b_hi)
+
+
+def intern(a: Sequence[str], b: Sequence[str]) -> tuple[list[int], list[int]]:
+    ids = {line: i for i, line in enumerate(dict.fromkeys(chain(a, b)))}
+    return list(map(ids.__getitem__, a)), list(map(ids.__getitem__, b))
+
+
+def snake(a: Sequence, b: Sequence, x: int, y: int, a_hi: int, b_hi: int) -> tuple[int, int]:
+    """Follows equal lines from (x, y), long runs are compared in slices"""
+    if x >= a_hi or y >= b_hi or a[x] != b[y]:
+        return x, y
+    step = SNAKE_STEP
+    while x + step <= a_hi and y + step <= b_hi and a[x:x + step] == b[y:y + step]:
+        x += step
+        y += step
+    while x < a_hi and y < b_hi and a[x] == b[y]:
+        x += 1
+        y += 1
+    return x, y
+
+
+def common_prefix(a: Sequence, b: Sequence, a_lo: int, a_hi: int, b_lo: int, b_hi: int) -> int:
+    return snake(a, b, a_lo, b_lo, a_hi, b_hi)[0] - a_lo
+
+
+def common_suffix(a: Sequence, b: Sequence, a_lo: int, a_hi: int, b_lo: int, b_hi: int) -> int:
+    length = 0
+    step = SNAKE_STEP
+    while a_hi - length - step >= a_lo and b_hi - length - step >= b_lo \
+            and a[a_hi - length - step:a_hi - length] == b[b_hi - length - step:b_hi - length]:
+        length += step
+    while a_hi - length > a_lo and b_hi - length > b_lo and a[a_hi - length - 1] == b[b_hi - length - 1]:
+        length += 1
+    return length
+
+
+def diff(a: Sequence[str], b: Sequence[str], algorithm: str = DEFAULT_ALGORITHM,
+         max_cost: int = MAX_EDIT_COST, timeout: float = TIMEOUT_SECONDS) -> list[Op]:
+    if algorithm not in ALGORITHMS:
+        raise ValueError(f'Unknown diff algorithm {algorithm}, expected one of {ALGORITHMS}')
+
+    n, m = len(a), len(b)
+    prefix = common_prefix(a, b, 0, n, 0, m)
+    guard = Guard(max_cost, timeout)
+
+    middle = Script()
+    if algorithm == 'myers':
+        suffix = 0
+        # the untrimmed suffix is mostly walked by a few long snakes, comparing lines directly is cheaper than interning it
+        a_lines, b_lines = a[prefix:], b[prefix:]
+    else:
+        suffix = common_suffix(a, b, prefix, n, prefix, m)
+        # only the lines in between are interned, indexes are relative to the prefix
+        a_lines, b_lines = intern(a[prefix:n - suffix], b[prefix:m - suffix])
+
+    try:
+        if algorithm == 'myers':
+            myers(a_lines, b_lines, 0, len(a_lines), 0, len(b_lines), middle, guard)
+        else:
+            solve(algorithm, a_lines, b_lines, 0, len(a_lines), 0, len(b_lines), middle, guard)
+    except DiffTooExpensive as e:
+        logging.info('Diff of %s and %s lines too expensive (%s), keeping both versions whole', n, m, e)
+        middle = Script()
+        middle.replace(0, len(a_lines), 0, len(b_lines))
+
+    script = Script()
+    script.add(KEEP, 0, prefix)
+    for action, start, end in middle.ops:
+        script.add(action, start + prefix, end + prefix)
+    script.add(KEEP, n - suffix, n)
+    return script.ops
+
+
+def iter_lines(ops: list[Op], a: Sequence[str], b: Sequence[str]) -> Iterator[tuple[str, str]]:
+    """(action, line) pairs like myers.diff returns them"""
+    for action, start, end in ops:
+        lines = b if action == INSERT else a
+        for i in range(start, end):
+            yield action, lines[i]
+
+
+def myers(a: Sequence, b: Sequence, a_lo: int, a_hi: int, b_lo: int, b_hi: int, script: Script, guard: Guard):
+    """Greedy forward Myers, the path is recovered from snapshots of the furthest reaching x per diagonal"""
+    n, m = a_hi - a_lo, b_hi - b_lo
+    if n == 0 or m == 0:
+        return script.replace(a_lo, a_hi, b_lo, b_hi)
+
+    max_d = n + m
+    offset = max_d + 1
+    v = [0] * (2 * max_d + 3)
+    trace = []
+
+    for d in range(max_d + 1):
+        guard.check(d)
+        # v[k] for k in -d - 1..d + 1, everything step d looks at
+        trace.append(v[offset - d - 1:offset + d + 2])
+
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[offset + k - 1] < v[offset + k + 1]):
+                x = v[offset + k + 1]
+            else:
+                x = v[offset + k - 1] + 1
+            y = x - k
+
+            if 0 <= x < n and 0 <= y < m:
+                x, y = snake(a, b, a_lo + x, b_lo + y, a_hi, b_hi)
+                x, y = x - a_lo, y - b_lo
+            v[offset + k] = x
+
+            if x >= n and y >= m:
+                return backtrack(trace, n, m, a_lo, b_lo, script)
+
+
+def backtrack(trace: list[list[int]], n: int, m: int, a_lo: int, b_lo: int, script: Script):
+    ops = []
+    x, y = n, m
+    for d in range(len(trace) - 1, -1, -1):
+        v = trace[d]
+        k = x - y
+        if k == -d or (k != d and v[d + k] < v[d + k + 2]):
+            prev_k = k + 1
+        else:
+            prev_k = k - 1
+        prev_x = v[d + 1 + prev_k]
+        prev_y = prev_x - prev_k
+
+        run = max(0, min(x - prev_x, y - prev_y))
+        if run:
+            x -= run
+            y -= run
+            ops.append((KEEP, a_lo + x, a_lo + x + run))
+
+        if d > 0:
+            if prev_k == k + 1:
+                ops.append((INSERT, b_lo + y - 1, b_lo + y))
+            else:
+                ops.append((REMOVE, a_lo + x - 1, a_lo + x))
+        x, y = prev_x, prev_y
+
+    for op in reversed(ops):
+        script.add(*op)
+
+
+def solve(algorithm: str, a: list[int], b: list[int], a_lo: int, a_hi: int, b_lo: int, b_hi: int,
+          script: Script, guard: Guard):
+    """
+    Splits regions until they are trivial.
+    Tasks are regions (a_lo, a_hi, b_lo, b_hi) and kept ranges (start, end) of a, processed in order.
+    """
+    split = SPLITTERS[algorithm]
+    tasks = [(a_lo, a_hi, b_lo, b_hi)]
+
+    while tasks:
+        task = tasks.pop()
+        if len(task) == 2:
+            script.add(KEEP, *task)
+            continue
+
+        a_lo, a_hi, b_lo, b_hi = task
+        prefix = common_prefix(a, b, a_lo, a_hi, b_lo, b_hi)
+        suffix = common_suffix(a, b, a_lo + prefix, a_hi, b_lo + prefix, b_hi)
+        script.add(KEEP, a_lo, a_lo + prefix)
+        tasks.append((a_hi - suffix, a_hi))
+        a_lo, a_hi, b_lo, b_hi = a_lo + prefix, a_hi - suffix, b_lo + prefix, b_hi - suffix
+
+        if a_lo == a_hi or b_lo == b_hi:
+            script.replace(a_lo, a_hi, b_lo, b_hi)
+            continue
+
+        subtasks = split(a, b, a_lo, a_hi, b_lo, b_hi, guard)
+        if subtasks is None:
+            myers(a, b, a_lo, a_hi, b_lo, b_hi, script, guard)
+        else:
+            tasks.extend(reversed(subtasks))
+
+
+def split_middle_snake(a: list[int], b: list[int], a_lo: int, a_hi: int, b_lo: int, b_hi: int, guard: Guard):
+    x0, y0, x1, y1 = middle_snake(a, b, a_lo, a_hi, b_lo, b_hi, guard)
+    return [(a_lo, x0, b_lo, y0), (x0, x1), (x1, a_hi, y1, b_hi)]
+
+
+def middle_snake(a: list[int], b: list[int], a_lo: int, a_hi: int, b_lo: int, b_hi: int, guard: Guard):
+    """Snake in the middle of an optimal path, searched from both ends at once, as absolute (x0, y0, x1, y1)"""
+    n, m = a_hi - a_lo, b_hi - b_lo
+    delta = n - m
+    odd = delta % 2 == 1
+    max_d = (n + m + 1) // 2
+    offset = max_d + 1
+    # forward x per diagonal k, backward x counted from the end per diagonal delta - k
+    forward = [0] * (2 * max_d + 3)
+    backward = [0] * (2 * max_d + 3)
+
+    for d in range(max_d + 1):
+        guard.check(2 * d)
+
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and forward[offset + k - 1] < forward[offset + k + 1]):
+                x = forward[offset + k + 1]
+            else:
+                x = forward[offset + k - 1] + 1
+            y = x - k
+            start_x, start_y = x, y
+            if 0 <= x < n and 0 <= y < m:
+                x, y = snake(a, b, a_lo + x, b_lo + y, a_hi, b_hi)
+                x, y = x - a_lo, y - b_lo
+            forward[offset + k] = x
+
+            back_k = delta - k
+            if odd and -d < back_k < d and x + backward[offset + back_k] >= n:
+                return a_lo + start_x, b_lo + start_y, a_lo + x, b_lo + y
+
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and backward[offset + k - 1] < backward[offset + k + 1]):
+                x = backward[offset + k + 1]
+            else:
+                x = backward[offset + k - 1] + 1
+            y = x - k
+            start_x, start_y = x, y
+            while x < n and y < m and a[a_hi - x - 1] == b[b_hi - y - 1]:
+                x += 1
+                y += 1
+            backward[offset + k] = x
+
+            forward_k = delta - k
+            if not odd and -d <= forward_k <= d and x + forward[offset + forward_k] >= n:
+                return a_hi - x, b_hi - y, a_hi - start_x, b_hi - start_y
+
+    raise AssertionError('middle snake not found')
+
+
+def split_patience(a: list[int], b: list[int], a_lo: int, a_hi: int, b_lo: int, b_hi: int, guard: Guard):
+    guard.check(0)
+    anchors = unique_common_subsequence(a, b, a_lo, a_hi, b_lo, b_hi)
+    if not anchors:
+        return None
+
+    subtasks = []
+    x, y = a_lo, b_lo
+    for i, j in anchors:
+        subtasks.append((x, i, y, j))
+        subtasks.append((i, i + 1))
+        x, y = i + 1, j + 1
+    subtasks.append((x, a_hi, y, b_hi))
+    return subtasks
+
+
+def unique_common_subsequence(a: list[int], b: list[int], a_lo: int, a_hi: int, b_lo: int, b_hi: int):
+    """Longest sequence of (i, j) pairs of lines that occur exactly once in both regions, in order in both"""
+    a_positions = dict()
+    for i in range(a_lo, a_hi):
+        a_positions[a[i]] = i if a[i] not in a_positions else -1
+    b_positions = dict()
+    for j in range(b_lo, b_hi):
+        if a_positions.get(b[j], -1) >= 0:
+            b_positions[b[j]] = j if b[j] not in b_positions else -1
+
+    pairs = sorted((a_positions[line], j) for line, j in b_positions.items() if j >= 0)
+
+    # patience sorting on j, every pile top remembers the top of the pile left of it
+    tops = []
+    tails = []
+    previous = []
+    for index, (i, j) in enumerate(pairs):
+        pile = bisect_left(tops, j)
+        if pile == len(tops):
+            tops.append(j)
+            tails.append(index)
+        else:
+            tops[pile] = j
+            tails[pile] = index
+        previous.append(tails[pile - 1] if pile > 0 else -1)
+
+    result = []
+    index = tails[-1] if tails else -1
+    while index >= 0:
+        result.append(pairs[index])
+        index = previous[index]
+    result.reverse()
+    return result
+
+
+def split_histogram(a: list[int], b: list[int], a_lo: int, a_hi: int, b_lo: int, b_hi: int, guard: Guard):
+    guard.check(0)
+    positions = dict()
+    for i in range(a_lo, a_hi):
+        positions.setdefault(a[i], []).append(i)
+
+    best = None
+    too_common = False
+    j = b_lo
+    while j < b_hi:
+        occurrences = positions.get(b[j])
+        next_j = j + 1
+        if occurrences is not None and len(occurrences) > MAX_CHAIN_LENGTH:
+            too_common = True
+        elif occurrences is not None and (best is None or len(occurrences) <= best[0]):
+            for i in occurrences:
+                start_i, start_j = i, j
+                while start_i > a_lo and start_j > b_lo and a[start_i - 1] == b[start_j - 1]:
+                    start_i -= 1
+                    start_j -= 1
+                end_i, end_j = i + 1, j + 1
+                while end_i < a_hi and end_j < b_hi and a[end_i] == b[end_j]:
+                    end_i += 1
+                    end_j += 1
+
+                # rarer lines first, longer matches among equally rare ones
+                candidate = (len(occurrences), -(end_i - start_i), start_i, start_j, end_i, end_j)
+                if best is None or candidate[:2] < best[:2]:
+                    best = candidate
+                next_j = max(next_j, end_j)
+        j = next_j
+
+    if best is None:
+        if too_common:
+            return None
+        return [(a_lo, a_hi, b_lo, b_lo), (a_hi, a_hi, b_lo, b_hi)]
+
+    _, _, start_i, start_j, end_i, end_j = best
+    return [(a_lo, start_i, b_lo, start_j), (start_i, end_i), (end_i, a_hi, end_j, b_hi)]
+
+
+SPLITTERS = {
+    'myers-linear': split_middle_snake,
+    'patience': split_patience,
+    'histogram': split_histogram,
+}
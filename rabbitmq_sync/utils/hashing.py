@@ -0,0 +1,32 @@
+import hashlib
+from pathlib import Path
+
+HASH_ALGORITHM = 'sha256'
+READ_BLOCK_SIZE = 1024 * 1024
+
+
+def new_hash():
+    return hashlib.new(HASH_ALGORITHM)
+
+
+def bytes_hash(content: bytes) -> str:
+    return hashlib.new(HASH_ALGORITHM, content).hexdigest()
+
+
+def read_with_hash(path: Path) -> tuple[bytes, str]:
+    """File content and its hash, hashed block by block while reading"""
+    h = new_hash()
+    blocks = []
+    with open(path, 'rb') as f:
+        while block := f.read(READ_BLOCK_SIZE):
+            h.update(block)
+            blocks.append(block)
+    return b''.join(blocks), h.hexdigest()
+
+
+def file_hash(path: Path) -> str:
+    h = new_hash()
+    with open(path, 'rb') as f:
+        while block := f.read(READ_BLOCK_SIZE):
+            h.update(block)
+    return h.hexdigest()
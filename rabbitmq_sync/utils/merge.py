@@ -0,0 +1,116 @@
+"""
+Three-way merge of text.
+
+Both versions are diffed against their common base. Changes to different parts of the base are applied together,
+changes to the same part become a conflict block unless both sides made the same change.
+"""
+from typing import Iterator
+
+from .diff import RENDER_BATCH_LINES
+from .diff_engine import KEEP, REMOVE, DEFAULT_ALGORITHM, diff
+
+# (base start, base end, side start, side end): base[base start:base end] became side[side start:side end]
+Hunk = tuple[int, int, int, int]
+
+
+def hunks(base: list[str], side: list[str], algorithm: str = DEFAULT_ALGORITHM) -> list[Hunk]:
+    result = []
+    base_pos = side_pos = 0
+    hunk_start = None
+
+    for action, start, end in diff(base, side, algorithm):
+        if action == KEEP:
+            if hunk_start is not None:
+                result.append((hunk_start[0], base_pos, hunk_start[1], side_pos))
+                hunk_start = None
+            base_pos += end - start
+            side_pos += end - start
+            continue
+
+        if hunk_start is None:
+            hunk_start = (base_pos, side_pos)
+        if action == REMOVE:
+            base_pos += end - start
+        else:
+            side_pos += end - start
+
+    if hunk_start is not None:
+        result.append((hunk_start[0], base_pos, hunk_start[1], side_pos))
+    return result
+
+
+def merge3(base: str, a: str, b: str, diff_postfix: str = None, algorithm: str = DEFAULT_ALGORITHM) -> str:
+    return ''.join(iter_merge3(base, a, b, diff_postfix, algorithm))
+
+
+def iter_merge3(base: str, a: str, b: str, diff_postfix: str = None,
+                algorithm: str = DEFAULT_ALGORITHM) -> Iterator[str]:
+    """Merged text in pieces, for writing it without holding all of it"""
+    base_lines, a_lines, b_lines = base.split('\n'), a.split('\n'), b.split('\n')
+    first = True
+
+    for region, conflict in merge_regions(base_lines, a_lines, b_lines, algorithm):
+        lines = conflict_lines(*region, diff_postfix) if conflict else region
+        for start in range(0, len(lines), RENDER_BATCH_LINES):
+            if not first:
+                yield '\n'
+            yield '\n'.join(lines[start:start + RENDER_BATCH_LINES])
+            first = False
+
+
+def merge_regions(base: list[str], a: list[str], b: list[str],
+                  algorithm: str = DEFAULT_ALGORITHM) -> Iterator[tuple[list[str] | tuple[list[str], list[str]], bool]]:
+    """Merged runs of lines in order, conflicts as (a lines, b lines)"""
+    # (base start, base end, side start, side end, side)
+    changes = sorted(
+        [(*hunk, 0) for hunk in hunks(base, a, algorithm)] +
+        [(*hunk, 1) for hunk in hunks(base, b, algorithm)])
+    sides = (a, b)
+    # lines of a side are at base position + shift outside of its hunks
+    shifts = [0, 0]
+    base_pos = 0
+
+    i = 0
+    while i < len(changes):
+        # changes that touch or overlap are resolved together
+        group = [changes[i]]
+        group_start, group_end = changes[i][0], changes[i][1]
+        i += 1
+        while i < len(changes) and changes[i][0] <= group_end:
+            group.append(changes[i])
+            group_end = max(group_end, changes[i][1])
+            i += 1
+
+        yield base[base_pos:group_start], False
+
+        parts = []
+        changed = set()
+        for side_index in (0, 1):
+            side_changes = [change for change in group if change[4] == side_index]
+            start = group_start + shifts[side_index]
+            for base_start, base_end, side_start, side_end, _ in side_changes:
+                shifts[side_index] = side_end - base_end
+            end = group_end + shifts[side_index]
+            parts.append(sides[side_index][start:end])
+            if side_changes:
+                changed.add(side_index)
+
+        a_part, b_part = parts
+        if changed == {0} or a_part == b_part:
+            yield a_part, False
+        elif changed == {1}:
+            yield b_part, False
+        else:
+            yield (a_part, b_part), True
+
+        base_pos = group_end
+
+    yield base[base_pos:], False
+
+
+def conflict_lines(a_part: list[str], b_part: list[str], diff_postfix: str = None) -> list[str]:
+    return [conflict_marker('<', diff_postfix), *a_part, '=' * 7, *b_part, conflict_marker('>', diff_postfix)]
+
+
+def conflict_marker(symbol: str, diff_postfix: str = None) -> str:
+    return symbol * 7 + (f' {diff_postfix}' if diff_postfix else '')
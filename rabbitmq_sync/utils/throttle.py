@@ -0,0 +1,29 @@
+import time
+from threading import Lock
+
+
+class TokenBucket:
+    """Bytes per second limiter, rate <= 0 means unlimited"""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated_on = time.monotonic()
+        self.lock = Lock()
+
+    def consume(self, amount: int):
+        if self.rate <= 0:
+            return
+
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_on) * self.rate)
+            self.updated_on = now
+
+            # going into debt lets messages bigger than the bucket through, the next ones wait for it
+            self.tokens -= amount
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+
+        if wait:
+            time.sleep(wait)
@@ -0,0 +1,96 @@
+"""
+Edit scripts of utils.diff_engine on random inputs: every algorithm has to turn a into b,
+the default one has to place edits exactly like the myers package it replaced, merges of disjoint edits must be clean.
+"""
+import random
+
+import pytest
+
+from rabbitmq_sync.utils.diff_engine import ALGORITHMS, KEEP, INSERT, REMOVE, diff, iter_lines
+from rabbitmq_sync.utils.merge import merge3
+
+SEED = 1
+CASES = 200
+# few distinct lines, so that equal lines repeat and edits can be placed in more than one way
+WORDS = ['a', 'b', 'c', 'd', '', 'x']
+
+
+def random_lines(rng: random.Random, max_length: int = 30) -> list[str]:
+    return [rng.choice(WORDS) for _ in range(rng.randrange(max_length))]
+
+
+def edited(rng: random.Random, lines: list[str]) -> list[str]:
+    lines = list(lines)
+    for _ in range(rng.randrange(6)):
+        i = rng.randrange(len(lines) + 1)
+        action = rng.choice((INSERT, REMOVE, 'change'))
+        if action == INSERT or i == len(lines):
+            lines.insert(i, rng.choice(WORDS))
+        elif action == REMOVE:
+            del lines[i]
+        else:
+            lines[i] = rng.choice(WORDS)
+    return lines
+
+
+def pairs(name: str):
+    rng = random.Random(f'{SEED}-{name}')
+    for _ in range(CASES):
+        a = random_lines(rng)
+        yield a, edited(rng, a) if rng.random() < 0.7 else random_lines(rng)
+
+
+def sides(ops, a, b) -> tuple[list[str], list[str]]:
+    """a and b rebuilt from an edit script"""
+    lines = list(iter_lines(ops, a, b))
+    return [line for action, line in lines if action != INSERT], [line for action, line in lines if action != REMOVE]
+
+
+@pytest.mark.parametrize('algorithm', ALGORITHMS)
+def test_round_trip(algorithm):
+    for a, b in pairs(algorithm):
+        assert sides(diff(a, b, algorithm), a, b) == (a, b)
+
+
+@pytest.mark.parametrize('algorithm', ALGORITHMS)
+def test_round_trip_over_max_cost(algorithm):
+    # regions that are too expensive become one removed and inserted block, still a valid script
+    for a, b in pairs(f'{algorithm}-guarded'):
+        assert sides(diff(a, b, algorithm, max_cost=2), a, b) == (a, b)
+
+
+@pytest.mark.parametrize('algorithm', ALGORITHMS)
+def test_equal_sides_keep_every_line(algorithm):
+    # the same lines on both sides are never an edit
+    for a, _ in pairs(f'{algorithm}-equal'):
+        assert list(iter_lines(diff(a, list(a), algorithm), a, a)) == [(KEEP, line) for line in a]
+
+
+def test_myers_parity():
+    myers = pytest.importorskip('myers')
+    for a, b in pairs('parity'):
+        assert list(iter_lines(diff(a, b, 'myers'), a, b)) == list(myers.diff(a, b))
+
+
+@pytest.mark.parametrize('algorithm', ALGORITHMS)
+def test_merge3_disjoint_edits(algorithm):
+    rng = random.Random(f'{SEED}-{algorithm}-merge')
+    for _ in range(CASES):
+        base = [f'line {i}' for i in range(rng.randrange(4, 40))]
+        a, b = list(base), list(base)
+        half = len(base) // 2
+        # at least one unchanged line between the edits, adjacent edits conflict like in git
+        a[rng.randrange(half - 1)] = 'a edited'
+        b[rng.randrange(half, len(base))] = 'b edited'
+        expected = [line_a if line_a != line else line_b for line, line_a, line_b in zip(base, a, b)]
+
+        assert merge3('\n'.join(base), '\n'.join(a), '\n'.join(b), algorithm=algorithm) == '\n'.join(expected)
+
+
+@pytest.mark.parametrize('algorithm', ALGORITHMS)
+def test_merge3_one_side(algorithm):
+    for base, b in pairs(f'{algorithm}-one-side'):
+        base, b = '\n'.join(base), '\n'.join(b)
+        assert merge3(base, base, b, algorithm=algorithm) == b
+        assert merge3(base, b, base, algorithm=algorithm) == b
+        assert merge3(base, b, b, algorithm=algorithm) == b